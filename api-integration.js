@@ -54,6 +54,26 @@ async function fetchProductById(productId) {
     }
 }
 
+/**
+ * Fetch several products by ID in one request
+ * Returns a map of id -> product (ids that don't exist are left out)
+ */
+async function fetchProductsByIds(productIds) {
+    try {
+        const response = await fetch(`${API_BASE_URL}/products?ids=${productIds.join(',')}`);
+        const data = await response.json();
+        
+        if (data.success) {
+            return data.products;
+        } else {
+            throw new Error(data.error);
+        }
+    } catch (error) {
+        console.error('Error fetching products:', error);
+        return {};
+    }
+}
+
 // ==================== SERVICES API ====================
 
 /**
@@ -170,6 +190,26 @@ async function fetchOrderById(orderId) {
     }
 }
 
+/**
+ * Fetch several orders (with items) by ID in one request
+ * Returns a map of id -> order (ids that don't exist are left out)
+ */
+async function fetchOrdersByIds(orderIds) {
+    try {
+        const response = await fetch(`${API_BASE_URL}/orders/batch?ids=${orderIds.join(',')}`);
+        const data = await response.json();
+        
+        if (data.success) {
+            return data.orders;
+        } else {
+            throw new Error(data.error);
+        }
+    } catch (error) {
+        console.error('Error fetching orders:', error);
+        return {};
+    }
+}
+
 // ==================== DISCOUNT API ====================
 
 /**
@@ -426,7 +466,9 @@ document.addEventListener('DOMContentLoaded', function() {
 if (typeof module !== 'undefined' && module.exports) {
     module.exports = {
         fetchProducts,
+        fetchProductsByIds,
         fetchServices,
+        fetchOrdersByIds,
         createOrderAPI,
         validateDiscountCode,
         fetchStatistics,
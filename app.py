@@ -1,19 +1,226 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timezone
 import sqlite3
 import json
 import os
+import time
+
+import click
+
+from config import config
+import database
+import json_provider
+import migrations
+import search as catalog_search
+import pagination
+import streaming
+import orders
+import idempotency
+import dashboard
+import metrics
+import compression
+import product_import
+import order_export
+import multiget
+import inventory
+import pricing
+import discounts
+import rate_limit
+from cache import CatalogCache
+from order_numbers import OrderNumberGenerator
+from database import get_db, get_writer
+from versions import TableVersions, read_versions
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend communication
+app.config.from_object(config[os.environ.get('FLASK_CONFIG', 'default')])
+app.json = json_provider.JSONProvider(app, app.config['JSON_ENCODER'])
+CORS(app, expose_headers=['X-Next-Cursor'])  # Enable CORS for frontend communication
+database.init_app(app)
+
+DATABASE = app.config['DATABASE']
+
+
+# Catalog prices for server-side order totals, valid per price version
+price_map = pricing.PriceMap()
+
+# Active discount codes and their rules, recompiled when a code changes
+discount_engine = discounts.DiscountEngine()
+
+# Unique, time-ordered order numbers (safe across threads and processes)
+order_numbers = OrderNumberGenerator(app.config['ORDER_WORKER_ID'])
+
+# Table version counters behind the ETags of the GET routes
+table_versions = TableVersions(app.config['TABLE_VERSION_REFRESH'])
+
+# Cached catalog reads, keyed by table version and invalidated by the routes
+# that write the catalog
+catalog_cache = CatalogCache(app.config['CATALOG_CACHE_SIZE'], app.config['CATALOG_CACHE_TTL'],
+                             versions=table_versions.get)
+
+# Last /api/stats payload, reused until orders/customers/products change
+dashboard_snapshot = dashboard.DashboardSnapshot()
+
+# Units held by checkout reservations; flushed to SQLite in the background
+# once the first hold is taken (see inventory.py)
+stock_ledger = inventory.StockLedger()
+
+def start_stock_ledger():
+    stock_ledger.start(lambda: get_writer(app), app.config['RESERVATION_FLUSH_SECONDS'])
+
+# Pick up the version bumps of a successful write right away
+@app.after_request
+def refresh_table_versions(response):
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        table_versions.refresh()
+    return response
+
+# Per-endpoint latency, response size and SQL counters behind /api/metrics
+request_metrics = metrics.Metrics()
+
+@app.before_request
+def start_request_metrics():
+    request_metrics.start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    size = None if response.is_streamed else response.calculate_content_length()
+    stats = request_metrics.finish_request(endpoint, request.method, response.status_code, size)
+    
+    # Opt-in slow query log, with the plan of each slow statement
+    threshold = app.config['SLOW_QUERY_MS']
+    if stats is not None and threshold is not None:
+        for sql, params, ms, plan in metrics.explain_slow_queries(get_db, stats, threshold):
+            request_metrics.count_slow_query(endpoint)
+            app.logger.warning('Slow query (%.1f ms) in %s: %s %s | plan: %s',
+                               ms, endpoint, sql, params, '; '.join(plan) or '-')
+    return response
+
+# Token buckets per client and endpoint (429), and load shedding once an
+# endpoint or the single writer is saturated (503), see rate_limit.py
+rate_limiter = rate_limit.RateLimiter(
+    rate_limit.store_from_url(app.config['RATE_LIMIT_STORAGE_URL']), app.config['RATE_LIMITS']
+)
+concurrency_limiter = rate_limit.ConcurrencyLimiter(app.config['CONCURRENCY_LIMITS'])
+
+def rate_limit_client():
+    header = app.config['RATE_LIMIT_CLIENT_HEADER']
+    if header and request.headers.get(header):
+        return request.headers[header].split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+def shed_response(reason):
+    response = jsonify({'success': False, 'error': f'Server busy ({reason}), retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(rate_limit.SHED_RETRY_AFTER)
+    return response
+
+@app.before_request
+def admit_request():
+    endpoint = request.endpoint
+    # CORS preflights do no work and must not spend the client's tokens
+    if endpoint is None or request.method == 'OPTIONS':
+        return None
+    
+    try:
+        checked = rate_limiter.check(rate_limit_client(), endpoint)
+    except Exception as e:
+        # Fail open: a rate limit store outage must not take the API down with it
+        rate_limiter.count_store_error()
+        app.logger.warning('Rate limit store failed, request let through: %s', e)
+        checked = None
+    if checked is not None:
+        allowed, g.rate_limit_headers = checked
+        if not allowed:
+            response = jsonify({'success': False, 'error': 'Too many requests, slow down'})
+            response.status_code = 429
+            return response
+    
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        writer = app.extensions.get('db_writer')
+        if writer is not None and writer.stats()['pending'] >= app.config['MAX_PENDING_WRITES']:
+            concurrency_limiter.count_shed()
+            return shed_response('write queue full')
+    
+    if not concurrency_limiter.acquire(endpoint):
+        return shed_response('too many concurrent requests')
+    g.concurrency_slot = endpoint
+    return None
+
+@app.after_request
+def finish_admission(response):
+    response.headers.extend(g.pop('rate_limit_headers', {}))
+    # Streamed bodies are produced after the request ends: keep the slot until they're done
+    if response.is_streamed and 'concurrency_slot' in g:
+        endpoint = g.pop('concurrency_slot')
+        response.call_on_close(lambda: concurrency_limiter.release(endpoint))
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    endpoint = g.pop('concurrency_slot', None)
+    if endpoint is not None:
+        concurrency_limiter.release(endpoint)
+
+# Negotiated gzip/brotli for larger responses; catalog payloads are compressed
+# once per table version instead of once per request (see compression.py)
+precompressed = compression.PrecompressedCache(app.config['COMPRESS_CACHE_BYTES'])
+
+@app.after_request
+def compress_response(response):
+    return compression.compress_response(request, response, app.config, precompressed)
 
-DATABASE = 'agrichem.db'
+# Open a standalone connection (outside of a request) with the configured pragmas
+def connect_db():
+    return database.connect(app.config['DATABASE'], app.config['DB_PRAGMAS'], app.config['DB_TIMEOUT'])
+
+# Columns exposed by the list endpoints (fields= projection), mapped to their SQL
+PRODUCT_COLUMNS = {name: name for name in (
+    'id', 'name', 'category', 'description', 'price', 'size', 'stock', 'rating', 'image_url', 'created_at'
+)}
+SERVICE_COLUMNS = {name: name for name in ('id', 'name', 'description', 'price', 'icon', 'created_at')}
+CUSTOMER_COLUMNS = {name: name for name in (
+    'id', 'name', 'email', 'phone', 'farm_size', 'crop_type', 'address', 'created_at'
+)}
+ORDER_COLUMNS = dict(
+    {name: f'o.{name}' for name in (
+        'id', 'order_number', 'customer_id', 'total_amount', 'status', 'delivery_address',
+        'special_notes', 'discount_code', 'discount_amount', 'created_at'
+    )},
+    customer_name='c.name',
+    customer_email='c.email'
+)
+
+# Route SQL lives here (and in the modules the routes call) so that
+# check_query_plans.py explains exactly the queries the routes run
+CUSTOMER_BY_EMAIL_QUERY = 'SELECT id FROM customers WHERE email = ?'
+
+def list_query(table, fields, columns, after, limit, conditions=(), params=()):
+    """SELECT (and params) for a list route over one table; paged lists are oldest first"""
+    keyset, keyset_params = pagination.keyset_condition(after, 'created_at', 'id')
+    query = f'SELECT {pagination.select_list(fields, columns)} FROM {table} {pagination.where_clause([*conditions, keyset])}'
+    if limit is not None:
+        query += f" {pagination.order_clause('created_at', 'id')} LIMIT {limit + 1}"
+    return query, tuple(params) + tuple(keyset_params)
+
+def orders_list_query(fields, after, limit):
+    """SELECT (and params) for GET /api/orders, newest first"""
+    keyset, params = pagination.keyset_condition(after, 'o.created_at', 'o.id', descending=True)
+    query = f'''
+        SELECT {pagination.select_list(fields, ORDER_COLUMNS)}
+        FROM orders o
+        JOIN customers c ON o.customer_id = c.id
+        {pagination.where_clause([keyset])}
+        {pagination.order_clause('o.created_at', 'o.id', descending=True)}
+        {f'LIMIT {limit + 1}' if limit is not None else ''}
+    '''
+    return query, tuple(params)
 
 # Database initialization
 def init_db():
     """Initialize the database with required tables"""
-    conn = sqlite3.connect(DATABASE)
+    conn = connect_db()
     cursor = conn.cursor()
     
     # Products table
@@ -114,21 +321,38 @@ def init_db():
     ''')
     
     conn.commit()
+    migrations.migrate(conn)
     conn.close()
     print("Database initialized successfully!")
 
-# Helper function to get database connection
-def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Create or upgrade the database; safe to call from several processes at once
+def prepare_database():
+    """Create tables, apply migrations and seed data as needed"""
+    if not os.path.exists(app.config['DATABASE']):
+        print("Creating database...")
+        init_db()
+        seed_data()
+    else:
+        print("Database already exists")
+        migrate_db()
+
+# Bring an existing database up to the latest schema version
+def migrate_db():
+    """Apply pending schema migrations (indexes etc.) to the database"""
+    conn = connect_db()
+    applied = migrations.migrate(conn)
+    conn.close()
+    return applied
 
 # Seed initial data
 def seed_data():
     """Add initial products and services to database"""
-    conn = get_db()
+    conn = connect_db()
     cursor = conn.cursor()
     
+    # Hold the write lock so concurrent starters can't both seed
+    cursor.execute('BEGIN IMMEDIATE')
+    
     # Check if products already exist
     cursor.execute('SELECT COUNT(*) FROM products')
     if cursor.fetchone()[0] == 0:
@@ -180,8 +404,9 @@ def seed_data():
             VALUES (?, ?)
         ''', discount_codes)
         print("Discount codes seeded successfully!")
-        conn.commit()
-        conn.close()
+    
+    conn.commit()
+    conn.close()
 
 # ==================== API ROUTES ====================
 
@@ -202,35 +427,65 @@ def home():
 # ==================== PRODUCTS ROUTES ====================
 
 @app.route('/api/products', methods=['GET'])
+@table_versions.conditional('products')
+@catalog_cache.cached('products')
 def get_products():
-    """Get all products or filter by category"""
+    """Get all products, filter by category, or get several by id"""
     try:
         conn = get_db()
         cursor = conn.cursor()
         
         category = request.args.get('category')
         search = request.args.get('search')
+        fields = pagination.parse_fields(request.args.get('fields'), PRODUCT_COLUMNS)
+        next_cursor = None
+        
+        if 'ids' in request.args:
+            # Multi-get: one IN query, keyed by id
+            ids = multiget.parse_ids(request.args['ids'])
+            cursor.execute(f'''
+                SELECT {pagination.select_list(fields, PRODUCT_COLUMNS)} FROM products
+                WHERE id IN ({multiget.placeholders(ids)})
+            ''', ids)
+            found, missing = multiget.keyed(cursor.fetchall(), ids)
+            
+            return jsonify({
+                'success': True,
+                'count': len(found),
+                'products': {product_id: {name: row[name] for name in fields} for product_id, row in found.items()},
+                'missing': missing
+            })
         
-        if category:
-            cursor.execute('SELECT * FROM products WHERE category = ?', (category,))
-        elif search:
-            cursor.execute('SELECT * FROM products WHERE name LIKE ? OR description LIKE ?', 
-                         (f'%{search}%', f'%{search}%'))
+        if search and not category:
+            # Relevance-ranked full-text search (LIKE fallback without FTS5)
+            limit, offset = catalog_search.parse_paging(request.args)
+            rows = catalog_search.search_products(cursor, search, limit, offset)
+            products = [{name: row[name] for name in fields} for row in rows]
         else:
-            cursor.execute('SELECT * FROM products')
-        
-        products = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+            limit, after = pagination.parse_page(request.args)
+            query, params = list_query('products', fields, PRODUCT_COLUMNS, after, limit,
+                                       ['category = ?'] if category else [], [category] if category else [])
+            
+            cursor.execute(query, params)
+            if streaming.wants_stream():
+                return streaming.ndjson_response(cursor, fields, limit)
+            
+            products, next_cursor = pagination.build_page(pagination.fetch_tuples(cursor), fields, limit)
         
         return jsonify({
             'success': True,
             'count': len(products),
-            'products': products
+            'products': products,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
+@table_versions.conditional('products')
+@catalog_cache.cached('products')
 def get_product(product_id):
     """Get a single product by ID"""
     try:
@@ -238,7 +493,6 @@ def get_product(product_id):
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
         product = cursor.fetchone()
-        conn.close()
         
         if product:
             return jsonify({
@@ -255,25 +509,24 @@ def add_product():
     """Add a new product"""
     try:
         data = request.json
-        conn = get_db()
-        cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO products (name, category, description, price, size, stock, rating)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['name'],
-            data['category'],
-            data.get('description', ''),
-            data['price'],
-            data.get('size', ''),
-            data.get('stock', 0),
-            data.get('rating', 0.0)
-        ))
-        
-        conn.commit()
-        product_id = cursor.lastrowid
-        conn.close()
+        def insert_product(cursor):
+            cursor.execute('''
+                INSERT INTO products (name, category, description, price, size, stock, rating)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data['name'],
+                data['category'],
+                data.get('description', ''),
+                data['price'],
+                data.get('size', ''),
+                data.get('stock', 0),
+                data.get('rating', 0.0)
+            ))
+            return cursor.lastrowid
+        
+        product_id = get_writer().run(insert_product)
+        catalog_cache.invalidate('products')
         
         return jsonify({
             'success': True,
@@ -288,26 +541,25 @@ def update_product(product_id):
     """Update a product"""
     try:
         data = request.json
-        conn = get_db()
-        cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE products 
-            SET name=?, category=?, description=?, price=?, size=?, stock=?, rating=?
-            WHERE id=?
-        ''', (
-            data['name'],
-            data['category'],
-            data.get('description', ''),
-            data['price'],
-            data.get('size', ''),
-            data.get('stock', 0),
-            data.get('rating', 0.0),
-            product_id
-        ))
-        
-        conn.commit()
-        conn.close()
+        def update(cursor):
+            cursor.execute('''
+                UPDATE products 
+                SET name=?, category=?, description=?, price=?, size=?, stock=?, rating=?
+                WHERE id=?
+            ''', (
+                data['name'],
+                data['category'],
+                data.get('description', ''),
+                data['price'],
+                data.get('size', ''),
+                data.get('stock', 0),
+                data.get('rating', 0.0),
+                product_id
+            ))
+        
+        get_writer().run(update)
+        catalog_cache.invalidate('products')
         
         return jsonify({
             'success': True,
@@ -320,11 +572,8 @@ def update_product(product_id):
 def delete_product(product_id):
     """Delete a product"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
-        conn.commit()
-        conn.close()
+        get_writer().run(lambda cursor: cursor.execute('DELETE FROM products WHERE id = ?', (product_id,)))
+        catalog_cache.invalidate('products')
         
         return jsonify({
             'success': True,
@@ -333,23 +582,49 @@ def delete_product(product_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/products/import', methods=['POST'])
+def import_products():
+    """Bulk insert/update products from a CSV or NDJSON body"""
+    try:
+        fmt = product_import.detect_format(request.content_type, request.args.get('format'))
+        records = product_import.read_records(request.stream, fmt)
+        report = product_import.import_products(records, get_writer(), app.config['IMPORT_CHUNK_ROWS'])
+        
+        if report['inserted'] or report['updated']:
+            catalog_cache.invalidate('products')
+        
+        return jsonify(dict(success=True, **report))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ==================== SERVICES ROUTES ====================
 
 @app.route('/api/services', methods=['GET'])
+@table_versions.conditional('services')
+@catalog_cache.cached('services')
 def get_services():
     """Get all services"""
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM services')
-        services = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        
+        fields = pagination.parse_fields(request.args.get('fields'), SERVICE_COLUMNS)
+        limit, after = pagination.parse_page(request.args)
+        query, params = list_query('services', fields, SERVICE_COLUMNS, after, limit)
+        
+        cursor.execute(query, params)
+        services, next_cursor = pagination.build_page(pagination.fetch_tuples(cursor), fields, limit)
         
         return jsonify({
             'success': True,
             'count': len(services),
-            'services': services
+            'services': services,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -358,31 +633,30 @@ def book_service():
     """Book a service"""
     try:
         data = request.json
-        conn = get_db()
-        cursor = conn.cursor()
         
-        # Check if customer exists, if not create
-        cursor.execute('SELECT id FROM customers WHERE email = ?', (data['email'],))
-        customer = cursor.fetchone()
-        
-        if customer:
-            customer_id = customer[0]
-        else:
+        def book(cursor):
+            # Check if customer exists, if not create
+            cursor.execute(CUSTOMER_BY_EMAIL_QUERY, (data['email'],))
+            customer = cursor.fetchone()
+            
+            if customer:
+                customer_id = customer[0]
+            else:
+                cursor.execute('''
+                    INSERT INTO customers (name, email, phone, address)
+                    VALUES (?, ?, ?, ?)
+                ''', (data['name'], data['email'], data['phone'], data.get('address', '')))
+                customer_id = cursor.lastrowid
+            
+            # Create service booking
             cursor.execute('''
-                INSERT INTO customers (name, email, phone, address)
-                VALUES (?, ?, ?, ?)
-            ''', (data['name'], data['email'], data['phone'], data.get('address', '')))
-            customer_id = cursor.lastrowid
-        
-        # Create service booking
-        cursor.execute('''
-            INSERT INTO service_bookings (customer_id, service_id, notes)
-            VALUES (?, ?, ?)
-        ''', (customer_id, data['service_id'], data.get('notes', '')))
-        
-        booking_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+                INSERT INTO service_bookings (customer_id, service_id, notes)
+                VALUES (?, ?, ?)
+            ''', (customer_id, data['service_id'], data.get('notes', '')))
+            
+            return cursor.lastrowid
+        
+        booking_id = get_writer().run(book)
         
         return jsonify({
             'success': True,
@@ -395,24 +669,36 @@ def book_service():
 # ==================== CUSTOMERS ROUTES ====================
 
 @app.route('/api/customers', methods=['GET'])
+@table_versions.conditional('customers')
 def get_customers():
     """Get all customers"""
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM customers')
-        customers = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        
+        fields = pagination.parse_fields(request.args.get('fields'), CUSTOMER_COLUMNS)
+        limit, after = pagination.parse_page(request.args)
+        query, params = list_query('customers', fields, CUSTOMER_COLUMNS, after, limit)
+        
+        cursor.execute(query, params)
+        if streaming.wants_stream():
+            return streaming.ndjson_response(cursor, fields, limit)
+        
+        customers, next_cursor = pagination.build_page(pagination.fetch_tuples(cursor), fields, limit)
         
         return jsonify({
             'success': True,
             'count': len(customers),
-            'customers': customers
+            'customers': customers,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/customers/<int:customer_id>', methods=['GET'])
+@table_versions.conditional('customers')
 def get_customer(customer_id):
     """Get a single customer by ID"""
     try:
@@ -420,7 +706,6 @@ def get_customer(customer_id):
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM customers WHERE id = ?', (customer_id,))
         customer = cursor.fetchone()
-        conn.close()
         
         if customer:
             return jsonify({
@@ -435,69 +720,113 @@ def get_customer(customer_id):
 # ==================== ORDERS ROUTES ====================
 
 @app.route('/api/orders', methods=['GET'])
+@table_versions.conditional('orders', 'customers', expand={'items': ('order_items', 'products')})
 def get_orders():
-    """Get all orders"""
+    """Get all orders, newest first (expand=items embeds each order's items)"""
     try:
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT o.*, c.name as customer_name, c.email as customer_email
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.id
-            ORDER BY o.created_at DESC
-        ''')
+        fields = pagination.parse_fields(request.args.get('fields'), ORDER_COLUMNS)
+        expand = pagination.parse_expand(request.args.get('expand'), ('items',))
+        limit, after = pagination.parse_page(request.args)
+        page_query, params = orders_list_query(fields, after, limit)
         
-        orders = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        cursor.execute(page_query, params)
+        
+        if streaming.wants_stream():
+            if expand:
+                raise ValueError('expand is not supported for streamed responses')
+            return streaming.ndjson_response(cursor, fields, limit)
+        
+        rows = pagination.fetch_tuples(cursor)
+        orders, next_cursor = pagination.build_page(rows, fields, limit)
+        
+        if 'items' in expand:
+            # One query for the items of the whole page, with the page query as
+            # the window of order ids (not one query per order)
+            id_index = pagination.page_columns(fields).index('id')
+            multiget.embed_items(cursor, {row[id_index]: order for row, order in zip(rows, orders)},
+                                 f'SELECT id FROM ({page_query})', params)
         
         return jsonify({
             'success': True,
             'count': len(orders),
-            'orders': orders
+            'orders': orders,
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/orders/export', methods=['GET'])
+def export_orders():
+    """Stream orders with their items and customers as CSV or columnar chunks"""
+    try:
+        fmt = request.args.get('format', 'csv')
+        if fmt not in order_export.FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(order_export.FORMATS)}")
+        fields = pagination.parse_fields(request.args.get('fields'), order_export.EXPORT_COLUMNS)
+        since, until = request.args.get('from'), request.args.get('to')
+        order_export.date_range(since, until)  # reject bad dates before streaming starts
+        
+        # Its own connection, so a long download doesn't hold a pooled one
+        conn = connect_db()
+        mimetype, extension = order_export.FORMATS[fmt]
+        response = Response(
+            order_export.iter_export(conn, fmt, fields, since, until, app.config['EXPORT_CHUNK_ROWS']),
+            mimetype=mimetype
+        )
+        response.call_on_close(conn.close)
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename="orders-{since or "start"}-{until or "now"}.{extension}"'
+        )
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/orders/batch', methods=['GET'])
+@table_versions.conditional('orders', 'order_items', 'customers', 'products')
+def get_orders_batch():
+    """Get several orders with their items by id (?ids=1,2,3), keyed by id"""
+    try:
+        ids = multiget.parse_ids(request.args.get('ids'))
+        found, missing = multiget.fetch_orders(get_db().cursor(), ids)
+        
+        return jsonify({
+            'success': True,
+            'count': len(found),
+            'orders': found,
+            'missing': missing
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
+@table_versions.conditional('orders', 'order_items', 'customers', 'products')
 def get_order(order_id):
-    """Get a single order with items"""
+    """Get a single order with items (always embedded; expand=items is accepted)"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
+        pagination.parse_expand(request.args.get('expand'), ('items',))
         
-        # Get order details
-        cursor.execute('''
-            SELECT o.*, c.name as customer_name, c.email as customer_email, c.phone as customer_phone
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.id
-            WHERE o.id = ?
-        ''', (order_id,))
+        # Header and items in two queries, shared with the batch route
+        found, missing = multiget.fetch_orders(get_db().cursor(), [order_id])
         
-        order = cursor.fetchone()
-        
-        if not order:
+        if missing:
             return jsonify({'success': False, 'error': 'Order not found'}), 404
         
-        order_dict = dict(order)
-        
-        # Get order items
-        cursor.execute('''
-            SELECT oi.*, p.name as product_name, p.category
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            WHERE oi.order_id = ?
-        ''', (order_id,))
-        
-        items = [dict(row) for row in cursor.fetchall()]
-        order_dict['items'] = items
-        
-        conn.close()
-        
         return jsonify({
             'success': True,
-            'order': order_dict
+            'order': found[order_id]
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -506,103 +835,176 @@ def create_order():
     """Create a new order"""
     try:
         data = request.json
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Check if customer exists, if not create
-        cursor.execute('SELECT id FROM customers WHERE email = ?', (data['customer']['email'],))
-        customer = cursor.fetchone()
-        
-        if customer:
-            customer_id = customer[0]
-            # Update customer info
-            cursor.execute('''
-                UPDATE customers 
-                SET name=?, phone=?, farm_size=?, crop_type=?, address=?
-                WHERE id=?
-            ''', (
-                data['customer']['name'],
-                data['customer']['phone'],
-                data['customer'].get('farm_size'),
-                data['customer'].get('crop_type'),
-                data['customer'].get('delivery'),
-                customer_id
-            ))
-        else:
-            cursor.execute('''
-                INSERT INTO customers (name, email, phone, farm_size, crop_type, address)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                data['customer']['name'],
-                data['customer']['email'],
-                data['customer']['phone'],
-                data['customer'].get('farm_size'),
-                data['customer'].get('crop_type'),
-                data['customer'].get('delivery')
-            ))
-            customer_id = cursor.lastrowid
-        
-        # Generate order number
-        order_number = f"ORD-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # Calculate discount
-        discount_amount = 0.0
+        idempotency_key = request.headers.get('Idempotency-Key')
+        request_hash = idempotency.fingerprint(request.get_data())
+        if idempotency_key is not None:
+            idempotency.validate_key(idempotency_key)
+            # A retried request gets the original response without touching stock
+            replay = idempotency.lookup(get_db().cursor(), idempotency_key, request_hash)
+            if replay:
+                response = jsonify(replay[0])
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response, replay[1]
+        
+        # Refuse an unusable discount code before holding any stock (checked
+        # again against the committed rules in the order's transaction)
         discount_code = data.get('discount_code')
-        
         if discount_code:
-            cursor.execute('SELECT discount_percentage FROM discount_codes WHERE code = ? AND active = 1', 
-                         (discount_code,))
-            discount = cursor.fetchone()
-            if discount:
-                discount_amount = float(data['total']) * (discount[0] / 100)
-        
-        final_total = float(data['total']) - discount_amount
-        
-        # Create order
-        cursor.execute('''
-            INSERT INTO orders (order_number, customer_id, total_amount, delivery_address, 
-                              special_notes, discount_code, discount_amount)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            order_number,
-            customer_id,
-            final_total,
-            data['customer'].get('delivery'),
-            data['customer'].get('notes'),
-            discount_code,
-            discount_amount
-        ))
-        
-        order_id = cursor.lastrowid
-        
-        # Add order items
-        for item in data['items']:
-            # Get product ID by name
-            cursor.execute('SELECT id, price FROM products WHERE name = ?', (item['product'],))
-            product = cursor.fetchone()
+            discount_engine.load(get_db().cursor(), table_versions.get('discount_rules')[0])
+            discount_engine.rule(discount_code)
+        
+        # The units come from the cart's reservation, or from a short hold of the
+        # order's own, so it can't take units other checkouts are holding
+        reservation_id = data.get('reservation_id')
+        start_stock_ledger()
+        if reservation_id is not None:
+            if not isinstance(reservation_id, str):
+                raise ValueError('reservation_id must be a string')
+            hold_id, hold = reservation_id, stock_ledger.get(reservation_id)
+            lines, _ = orders.resolve_lines(get_db().cursor(), data['items'])
+        else:
+            hold, lines = inventory.reserve(stock_ledger, get_db().cursor(), data['items'],
+                                            inventory.ORDER_HOLD_SECONDS)
+            hold_id = hold.id
+        
+        # The whole order is one job for the single writer, so it runs in one
+        # write transaction with the stock it takes
+        def place_order(cursor):
+            # A concurrent retry that got here first wins; this one gets its response
+            if idempotency_key is not None:
+                replay = idempotency.lookup(cursor, idempotency_key, request_hash)
+                if replay:
+                    return replay[0], replay[1], True
             
-            if product:
+            # Consume the reservation along with the order
+            if reservation_id is not None:
+                inventory.claim(cursor, reservation_id, hold, orders.requested_quantities(lines), time.time())
+            
+            # Check if customer exists, if not create
+            cursor.execute(CUSTOMER_BY_EMAIL_QUERY, (data['customer']['email'],))
+            customer = cursor.fetchone()
+            
+            if customer:
+                customer_id = customer[0]
+                # Update customer info
                 cursor.execute('''
-                    INSERT INTO order_items (order_id, product_id, quantity, price)
-                    VALUES (?, ?, ?, ?)
-                ''', (order_id, product[0], item['quantity'], item['price']))
-                
-                # Update product stock
+                    UPDATE customers 
+                    SET name=?, phone=?, farm_size=?, crop_type=?, address=?
+                    WHERE id=?
+                ''', (
+                    data['customer']['name'],
+                    data['customer']['phone'],
+                    data['customer'].get('farm_size'),
+                    data['customer'].get('crop_type'),
+                    data['customer'].get('delivery'),
+                    customer_id
+                ))
+            else:
                 cursor.execute('''
-                    UPDATE products SET stock = stock - ? WHERE id = ?
-                ''', (item['quantity'], product[0]))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Order created successfully',
-            'order_number': order_number,
-            'order_id': order_id,
-            'final_total': final_total,
-            'discount_applied': discount_amount
-        }), 201
+                    INSERT INTO customers (name, email, phone, farm_size, crop_type, address)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    data['customer']['name'],
+                    data['customer']['email'],
+                    data['customer']['phone'],
+                    data['customer'].get('farm_size'),
+                    data['customer'].get('crop_type'),
+                    data['customer'].get('delivery')
+                ))
+                customer_id = cursor.lastrowid
+            
+            # Price the cart from the catalog (the client's prices and total are ignored)
+            # and count the discount code's use in the same transaction
+            # The rules and price versions committed with the order, not the (up to 1s old) snapshot
+            price_version, rules_version = read_versions(cursor, 'product_prices', 'discount_rules')
+            rule = None
+            if discount_code:
+                discount_engine.load(cursor, rules_version)
+                rule = discount_engine.rule(discount_code)
+            
+            prices = price_map.get(cursor, list(orders.requested_quantities(lines)), price_version)
+            subtotal, discount_amount, final_total = pricing.quote(lines, prices, rule)
+            subtotal, discount_amount, final_total = float(subtotal), float(discount_amount), float(final_total)
+            if rule is not None:
+                discount_engine.redeem(cursor, rule)
+            
+            # Create order. Numbers only clash if two processes share a worker id;
+            # then a fresh number is drawn (the failed INSERT doesn't end the transaction)
+            for attempt in range(3):
+                order_number = order_numbers.next()
+                try:
+                    cursor.execute('''
+                        INSERT INTO orders (order_number, customer_id, total_amount, delivery_address, 
+                                          special_notes, discount_code, discount_amount)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        order_number,
+                        customer_id,
+                        final_total,
+                        data['customer'].get('delivery'),
+                        data['customer'].get('notes'),
+                        rule.code if rule is not None else None,
+                        discount_amount
+                    ))
+                    break
+                except sqlite3.IntegrityError as e:
+                    if 'order_number' not in str(e) or attempt == 2:
+                        raise
+            
+            order_id = cursor.lastrowid
+            
+            # Add order items and take them out of stock (one statement each)
+            orders.add_order_items(cursor, order_id, lines)
+            orders.decrement_stock(cursor, lines)
+            # On the writer thread, so the ledger never counts these units twice;
+            # put back below if the batch fails to commit
+            confirmed.append(stock_ledger.confirm(hold_id))
+            
+            result = {
+                'success': True,
+                'message': 'Order created successfully',
+                'order_number': order_number,
+                'order_id': order_id,
+                'subtotal': subtotal,
+                'final_total': final_total,
+                'discount_applied': discount_amount
+            }
+            if idempotency_key is not None:
+                idempotency.store(cursor, idempotency_key, request_hash, result, 201,
+                                  app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+            
+            return result, 201, False
+        
+        confirmed = []
+        try:
+            result, status, replayed = get_writer().run(place_order)
+        except Exception:
+            # Nothing was committed, so the units are still held
+            for hold in filter(None, confirmed):
+                stock_ledger.restore(hold)
+            if reservation_id is None:
+                stock_ledger.release(hold_id)
+            raise
+        
+        response = jsonify(result)
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+            if reservation_id is None:
+                stock_ledger.release(hold_id)
+        else:
+            catalog_cache.invalidate('products')  # stock counts changed
+        
+        return response, status
+    except orders.InsufficientStockError as e:
+        return jsonify({'success': False, 'error': str(e), 'shortages': e.shortages}), 409
+    except inventory.ReservationError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except discounts.DiscountError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except idempotency.IdempotencyKeyReused as e:
+        return jsonify({'success': False, 'error': str(e)}), 422
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -611,14 +1013,9 @@ def update_order_status(order_id):
     """Update order status"""
     try:
         data = request.json
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        cursor.execute('UPDATE orders SET status = ? WHERE id = ?', 
-                      (data['status'], order_id))
         
-        conn.commit()
-        conn.close()
+        get_writer().run(lambda cursor: cursor.execute('UPDATE orders SET status = ? WHERE id = ?', 
+                                                       (data['status'], order_id)))
         
         return jsonify({
             'success': True,
@@ -627,132 +1024,212 @@ def update_order_status(order_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== RESERVATIONS ROUTES ====================
+
+def reservation_payload(reservation_id, quantities, expires_at):
+    return {
+        'reservation_id': reservation_id,
+        'items': [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()],
+        'expires_at': datetime.fromtimestamp(expires_at, timezone.utc).isoformat(timespec='seconds'),
+        'expires_in': max(0, round(expires_at - time.time()))
+    }
+
+@app.route('/api/reservations', methods=['POST'])
+def create_reservation():
+    """Hold stock for a cart until the order is placed or the hold expires"""
+    try:
+        data = request.json
+        ttl = inventory.parse_ttl(data.get('ttl'), app.config['RESERVATION_TTL_SECONDS'],
+                                  app.config['RESERVATION_MAX_TTL_SECONDS'])
+        
+        start_stock_ledger()
+        hold, lines = inventory.reserve(stock_ledger, get_db().cursor(), data['items'], ttl)
+        
+        return jsonify(dict(
+            {'success': True, 'message': 'Stock reserved'},
+            **reservation_payload(hold.id, hold.quantities, hold.expires_at)
+        )), 201
+    except orders.InsufficientStockError as e:
+        return jsonify({'success': False, 'error': str(e), 'shortages': e.shortages}), 409
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/reservations/<reservation_id>', methods=['GET'])
+def get_reservation(reservation_id):
+    """Get a live reservation (held by any server process once flushed)"""
+    try:
+        hold = stock_ledger.get(reservation_id)
+        if hold is not None:
+            quantities, expires_at = hold.quantities, hold.expires_at
+        else:
+            cursor = get_db().cursor()
+            cursor.execute('''
+                SELECT product_id, quantity, expires_at FROM stock_reservations
+                WHERE id = ? AND expires_at > ?
+            ''', (reservation_id, time.time()))
+            rows = cursor.fetchall()
+            if not rows:
+                return jsonify({'success': False, 'error': 'Reservation not found or expired'}), 404
+            quantities, expires_at = {row[0]: row[1] for row in rows}, rows[0][2]
+        
+        return jsonify(dict({'success': True}, **reservation_payload(reservation_id, quantities, expires_at)))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/reservations/<reservation_id>', methods=['DELETE'])
+def release_reservation(reservation_id):
+    """Release a reservation's stock before it expires"""
+    try:
+        released = stock_ledger.release(reservation_id)
+        if not released:
+            # Held by another process: it drops the hold on its next flush
+            deleted = get_writer().run(lambda cursor: cursor.execute(
+                'DELETE FROM stock_reservations WHERE id = ?', (reservation_id,)
+            ).rowcount)
+            released = deleted > 0
+        if not released:
+            return jsonify({'success': False, 'error': 'Reservation not found or expired'}), 404
+        
+        return jsonify({'success': True, 'message': 'Reservation released'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ==================== DISCOUNT CODES ROUTES ====================
 
 @app.route('/api/discount/validate', methods=['POST'])
 def validate_discount():
-    """Validate a discount code"""
+    """Validate a discount code, optionally against a cart (items)"""
     try:
         data = request.json
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT code, discount_percentage 
-            FROM discount_codes 
-            WHERE code = ? AND active = 1
-        ''', (data['code'].upper(),))
+        cursor = get_db().cursor()
         
-        discount = cursor.fetchone()
-        conn.close()
+        code = data.get('code')
+        if not isinstance(code, str) or not code.strip():
+            raise ValueError('code is required')
         
-        if discount:
-            return jsonify({
-                'success': True,
-                'valid': True,
-                'code': discount[0],
-                'discount_percentage': discount[1]
-            })
-        else:
-            return jsonify({
-                'success': True,
-                'valid': False,
-                'message': 'Invalid or expired discount code'
-            })
+        discount_engine.load(cursor, table_versions.get('discount_rules')[0])
+        try:
+            rule = discount_engine.rule(code)
+            result = {'success': True, 'valid': True, **rule.to_dict()}
+            
+            # With the cart, check its minimum and category and work out the discount
+            if data.get('items'):
+                lines, _ = orders.resolve_lines(cursor, data['items'])
+                prices = price_map.get(cursor, list(orders.requested_quantities(lines)),
+                                       table_versions.get('product_prices')[0])
+                subtotal, discount_amount, final_total = pricing.quote(lines, prices, rule)
+                result.update({
+                    'subtotal': float(subtotal),
+                    'discount_amount': float(discount_amount),
+                    'final_total': float(final_total)
+                })
+        except discounts.DiscountError as e:
+            result = {'success': True, 'valid': False, 'message': str(e)}
+        
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # ==================== STATISTICS ROUTES ====================
 
 @app.route('/api/stats', methods=['GET'])
+@table_versions.conditional('orders', 'customers', 'products')
 def get_statistics():
     """Get dashboard statistics"""
     try:
         conn = get_db()
         cursor = conn.cursor()
         
-        # Total orders
-        cursor.execute('SELECT COUNT(*) FROM orders')
-        total_orders = cursor.fetchone()[0]
-        
-        # Total revenue
-        cursor.execute('SELECT SUM(total_amount) FROM orders WHERE status != "cancelled"')
-        total_revenue = cursor.fetchone()[0] or 0
-        
-        # Total customers
-        cursor.execute('SELECT COUNT(*) FROM customers')
-        total_customers = cursor.fetchone()[0]
-        
-        # Total products
-        cursor.execute('SELECT COUNT(*) FROM products')
-        total_products = cursor.fetchone()[0]
-        
-        # Recent orders
-        cursor.execute('''
-            SELECT o.order_number, o.total_amount, o.status, o.created_at, c.name
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.id
-            ORDER BY o.created_at DESC
-            LIMIT 5
-        ''')
-        recent_orders = [dict(row) for row in cursor.fetchall()]
-        
-        # Low stock products
-        cursor.execute('SELECT * FROM products WHERE stock < 50 ORDER BY stock ASC')
-        low_stock = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
+        # Totals are maintained by triggers; the payload is only rebuilt
+        # when one of the tables it depends on has changed
+        versions = table_versions.get('orders', 'customers', 'products')
+        statistics = dashboard_snapshot.get(cursor, versions)
         
         return jsonify({
             'success': True,
-            'statistics': {
-                'total_orders': total_orders,
-                'total_revenue': round(total_revenue, 2),
-                'total_customers': total_customers,
-                'total_products': total_products,
-                'recent_orders': recent_orders,
-                'low_stock_products': low_stock
-            }
+            'statistics': statistics
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== MONITORING ROUTES ====================
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get catalog cache hit/miss counters"""
+    return jsonify({
+        'success': True,
+        'cache': catalog_cache.stats(),
+        'precompressed': precompressed.stats(),
+        'prices': price_map.stats(),
+        'discounts': discount_engine.stats()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request, SQL, cache and writer metrics in Prometheus text format"""
+    cache_stats = catalog_cache.stats()
+    compressed_stats = precompressed.stats()
+    writer = app.extensions.get('db_writer')
+    writer_stats = writer.stats() if writer is not None else {'batches': 0, 'jobs': 0, 'pending': 0}
+    admission_stats = concurrency_limiter.stats()
+    rate_limit_stats = rate_limiter.stats()
+    ledger_stats = stock_ledger.stats()
+    
+    extra = {
+        'agrichem_catalog_cache_entries': ('gauge', 'Entries in the catalog cache', cache_stats['entries']),
+        'agrichem_catalog_cache_hits_total': ('counter', 'Catalog cache hits', cache_stats['hits']),
+        'agrichem_catalog_cache_misses_total': ('counter', 'Catalog cache misses', cache_stats['misses']),
+        'agrichem_precompressed_hits_total': ('counter', 'Responses served from an already compressed payload', compressed_stats['hits']),
+        'agrichem_precompressed_misses_total': ('counter', 'Catalog payloads compressed and kept', compressed_stats['misses']),
+        'agrichem_precompressed_bytes': ('gauge', 'Size of the kept compressed payloads', compressed_stats['bytes']),
+        'agrichem_writer_batches_total': ('counter', 'Transactions committed by the single writer', writer_stats['batches']),
+        'agrichem_writer_jobs_total': ('counter', 'Write requests committed by the single writer', writer_stats['jobs']),
+        'agrichem_writer_pending': ('gauge', 'Write requests waiting for the single writer', writer_stats['pending']),
+        'agrichem_requests_shed_total': ('counter', 'Requests refused with 503 by load shedding', admission_stats['shed']),
+        'agrichem_rate_limit_store_errors_total': ('counter', 'Rate limit checks skipped because the store failed', rate_limit_stats['store_errors']),
+        'agrichem_reservations_active': ('gauge', 'Stock holds live in this process', ledger_stats['active']),
+        'agrichem_reservation_held_units': ('gauge', 'Units held by this process', ledger_stats['held_units']),
+        'agrichem_reservations_rejected_total': ('counter', 'Holds refused for lack of available stock', ledger_stats['rejected']),
+        'agrichem_reservations_expired_total': ('counter', 'Holds that expired unconfirmed', ledger_stats['expired']),
+        'agrichem_reservation_flush_errors_total': ('counter', 'Failed flushes of the stock ledger', ledger_stats['flush_errors'])
+    }
+    
+    return Response(request_metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
 # ==================== SEARCH ROUTE ====================
 
 @app.route('/api/search', methods=['GET'])
+@table_versions.conditional('products', 'services')
 def search():
     """Global search across products and services"""
     try:
         query = request.args.get('q', '')
+        limit, offset = catalog_search.parse_paging(request.args)
         conn = get_db()
         cursor = conn.cursor()
         
-        # Search products
-        cursor.execute('''
-            SELECT 'product' as type, id, name, description, price 
-            FROM products 
-            WHERE name LIKE ? OR description LIKE ?
-        ''', (f'%{query}%', f'%{query}%'))
-        products = [dict(row) for row in cursor.fetchall()]
-        
-        # Search services
-        cursor.execute('''
-            SELECT 'service' as type, id, name, description, price 
-            FROM services 
-            WHERE name LIKE ? OR description LIKE ?
-        ''', (f'%{query}%', f'%{query}%'))
-        services = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
+        # Products and services in one relevance-ranked query
+        results = [dict(row) for row in catalog_search.search_catalog(cursor, query, limit, offset)]
+        products = [r for r in results if r['type'] == 'product']
+        services = [r for r in results if r['type'] == 'service']
         
         return jsonify({
             'success': True,
             'results': {
                 'products': products,
                 'services': services,
-                'total': len(products) + len(services)
+                'total': len(results),
+                'limit': limit,
+                'offset': offset
             }
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -766,22 +1243,114 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
+# ==================== CLI COMMANDS ====================
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the materialized dashboard statistics from scratch"""
+    conn = connect_db()
+    dashboard.rebuild(conn)
+    conn.commit()
+    conn.close()
+    dashboard_snapshot.clear()
+    print("Dashboard statistics rebuilt successfully!")
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(product_import.FORMATS),
+              help='Input format (default: from the file extension)')
+def import_products_command(path, fmt):
+    """Bulk insert/update products from a CSV or NDJSON file"""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    started = time.perf_counter()
+    
+    with open(path, 'rb') as f:
+        report = product_import.import_products(
+            product_import.read_records(f, fmt), get_writer(), app.config['IMPORT_CHUNK_ROWS']
+        )
+    database.close_writer(app)
+    elapsed = time.perf_counter() - started
+    
+    print(f"{report['rows']} rows in {elapsed:.2f}s ({report['rows'] / elapsed:,.0f} rows/sec): "
+          f"{report['inserted']} inserted, {report['updated']} updated, {report['failed']} failed")
+    for error in report['errors']:
+        print(f"  row {error['row']}: {error['error']}")
+    if report['errors_truncated']:
+        print(f"  ... first {len(report['errors'])} errors shown")
+
+@app.cli.command('export-orders')
+@click.argument('output', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(list(order_export.FORMATS)),
+              help='Output format (default: from the file extension, csv for -)')
+@click.option('--from', 'since', help='First day (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS, UTC)')
+@click.option('--to', 'until', help='Last day, inclusive')
+def export_orders_command(output, fmt, since, until):
+    """Export orders with their items and customers to a file (- for stdout)"""
+    fmt = fmt or ('columnar' if output.lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    fields = list(order_export.EXPORT_COLUMNS)
+    try:
+        order_export.date_range(since, until)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    started = time.perf_counter()
+    
+    conn = connect_db()
+    size = 0
+    try:
+        with click.open_file(output, 'wb') as f:
+            for chunk in order_export.iter_export(conn, fmt, fields, since, until, app.config['EXPORT_CHUNK_ROWS']):
+                f.write(chunk)
+                size += len(chunk)
+    finally:
+        conn.close()
+    
+    if output != '-':
+        print(f"Exported {size / 1048576:,.1f} MB in {time.perf_counter() - started:.2f}s -> {output}")
+
+@app.cli.command('set-discount-code')
+@click.argument('code')
+@click.argument('percentage', type=click.FloatRange(0, 100))
+@click.option('--starts', help='Valid from (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS, UTC)')
+@click.option('--expires', help='Valid until, exclusive')
+@click.option('--max-uses', type=click.IntRange(min=1), help='Number of orders that can use it')
+@click.option('--min-order', type=click.FloatRange(min=0), default=0, help='Minimum order subtotal')
+@click.option('--category', help='Only discount the products of this category')
+@click.option('--inactive', is_flag=True, help='Disable the code')
+def set_discount_code_command(code, percentage, starts, expires, max_uses, min_order, category, inactive):
+    """Create or update a discount code and its rules"""
+    try:
+        starts, expires = [None if value is None else datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+                           for value in (starts, expires)]
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    
+    conn = connect_db()
+    conn.execute('''
+        INSERT INTO discount_codes (code, discount_percentage, active, starts_at, expires_at,
+                                    max_uses, min_order_value, category)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (code) DO UPDATE SET
+            discount_percentage = excluded.discount_percentage, active = excluded.active,
+            starts_at = excluded.starts_at, expires_at = excluded.expires_at, max_uses = excluded.max_uses,
+            min_order_value = excluded.min_order_value, category = excluded.category
+    ''', (code.upper(), percentage, 0 if inactive else 1, starts, expires, max_uses, min_order, category))
+    conn.commit()
+    conn.close()
+    print(f"Discount code {code.upper()} saved")
+
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
     # Initialize database and seed data
-    if not os.path.exists(DATABASE):
-        print("Creating database...")
-        init_db()
-        seed_data()
-    else:
-        print("Database already exists")
+    prepare_database()
     
     print("\n" + "="*50)
     print("AgriChem Solutions API Server")
     print("="*50)
     print("Server running on: http://localhost:5000")
     print("API Documentation: http://localhost:5000/")
+    print("For production use: python serve.py")
     print("="*50 + "\n")
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server only - see serve.py for the production server
+    app.run(debug=app.config['DEBUG'], host='0.0.0.0', port=5000)
@@ -0,0 +1,199 @@
+"""
+Async (ASGI) serving mode for AgriChem Solutions API
+Wraps the same Flask app, so every route answers exactly as in sync mode,
+but slow clients are handled on the event loop: the request body is read
+and the response written asynchronously, and a thread is only held while a
+route is actually running (and so talking to SQLite). Streamed responses
+(NDJSON lists, exports) are pulled one chunk per executor call, so a slow
+download holds no thread while it waits for the client.
+
+Route execution runs on a bounded thread pool. Writes need no executor of
+their own: the routes hand them to the single writer (see writer.py), so
+concurrent write requests are queued and group-committed instead of
+fighting over the SQLite write lock.
+
+Usage: uvicorn asgi:application --workers 4
+(leave ORDER_WORKER_ID unset: uvicorn workers all read the same value, while
+ids derived from the process id differ per worker)
+"""
+import asyncio
+import contextvars
+import io
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, prepare_database
+
+# Marks the end of a response body
+_END = object()
+
+
+class AsyncApp:
+    """ASGI application running a WSGI app on bounded executors"""
+    
+    def __init__(self, wsgi_app, workers=8, max_body_bytes=16 * 1024 * 1024):
+        self.wsgi_app = wsgi_app
+        self.max_body_bytes = max_body_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-route')
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+    
+    async def _lifespan(self, receive, send):
+        """Handle server startup/shutdown"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Safe in every worker: migrations and seeding take the write lock
+                prepare_database()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    def shutdown(self):
+        """Finish queued work and stop the executors"""
+        self.executor.shutdown(wait=True)
+    
+    async def _read_body(self, receive):
+        """Read the whole request body without holding a thread"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                raise ValueError('Request body too large')
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+    
+    async def _http(self, scope, receive, send):
+        try:
+            body = await self._read_body(receive)
+        except ValueError:
+            await self._send_simple(send, 413, b'{"error":"Request body too large","success":false}\n')
+            return
+        if body is None:
+            return
+        
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, body)
+        # Every step of the request runs in one context (Flask's request
+        # context lives in context variables), whichever thread it lands on
+        context = contextvars.copy_context()
+        
+        def run(fn, *args):
+            return loop.run_in_executor(self.executor, context.run, fn, *args)
+        
+        try:
+            status, headers, result, chunks, chunk = await run(self._start_wsgi, environ)
+        except Exception as error:
+            traceback.print_exception(error, file=sys.stderr)
+            await self._send_simple(send, 500, b'{"error":"Internal server error","success":false}\n')
+            return
+        
+        # The body has been read, so the next message can only be a disconnect
+        disconnect = asyncio.ensure_future(receive())
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            while chunk is not _END and not disconnect.done():
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                # One chunk per call: no thread waits while the client is slow
+                chunk = await run(next, chunks, _END)
+        except Exception as error:
+            traceback.print_exception(error, file=sys.stderr)
+        finally:
+            disconnected = disconnect.done()
+            disconnect.cancel()
+            if hasattr(result, 'close'):
+                await run(result.close)
+        
+        if not disconnected:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    
+    def _start_wsgi(self, environ):
+        """Run the WSGI app up to its first chunk: (status, headers, result, iterator, first chunk)"""
+        response_start = {}
+        
+        def start_response(status, headers, exc_info=None):
+            response_start['status'] = int(status.split(' ', 1)[0])
+            response_start['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+            return lambda data: None
+        
+        result = self.wsgi_app(environ, start_response)
+        try:
+            chunks = iter(result)
+            chunk = next(chunks, _END)
+        except Exception:
+            if hasattr(result, 'close'):
+                result.close()
+            raise
+        return response_start['status'], response_start['headers'], result, chunks, chunk
+    
+    async def _send_simple(self, send, status, body):
+        """Send a small JSON error response"""
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = f'HTTP_{name}'
+            # Repeated headers are joined with commas, except Cookie (RFC 6265)
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            environ[key] = f'{environ[key]}{separator}{value}' if key in environ else value
+    
+    return environ
+
+
+application = AsyncApp(
+    app,
+    workers=app.config['ASYNC_WORKERS'],
+    max_body_bytes=app.config['ASYNC_MAX_BODY_BYTES']
+)
@@ -0,0 +1,342 @@
+"""
+Load test and latency benchmark for AgriChem Solutions API
+Replays a weighted mix of the test_api.py scenarios (catalog browsing,
+search, checkout, order history, dashboard) from several threads at once,
+either in-process through Flask's test client or against a running server
+(--url), and reports p50/p95/p99 latency and throughput per endpoint.
+
+The database is built once with synthetic_data.py and reused; results are
+written as JSON (tagged with the git commit) so runs can be compared.
+Rate limits and concurrency caps are switched off in-process, as every
+thread would count as one client; with --url, run the server with them off
+too. 4xx responses are counted as rejected and left out of the latencies:
+
+    python benchmark.py --db bench.db --concurrency 8 --requests 5000
+    python benchmark.py --db bench.db --compare benchmark_results/<older run>.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+os.environ.setdefault('FLASK_CONFIG', 'production')
+
+from app import app, rate_limiter, concurrency_limiter
+import synthetic_data
+from database import connect
+
+RESULTS_DIR = 'benchmark_results'
+
+SEARCH_TERMS = ('chlor', 'neem', 'glypho', 'mancozeb', 'urea', 'imida', 'sulphur', 'delta')
+
+
+# ---- Scenarios: each returns (endpoint label, method, path, JSON body) ----
+
+def browse_category(rng, data):
+    category = rng.choice(synthetic_data.CATEGORIES)
+    return 'GET /api/products?category', 'GET', f'/api/products?category={category}&limit=50', None
+
+
+def browse_page(rng, data):
+    return 'GET /api/products?limit', 'GET', '/api/products?limit=50&fields=id,name,price,stock', None
+
+
+def view_product(rng, data):
+    return 'GET /api/products/<id>', 'GET', f'/api/products/{rng.choice(data["product_ids"])}', None
+
+
+def search_products(rng, data):
+    return 'GET /api/products?search', 'GET', f'/api/products?search={rng.choice(SEARCH_TERMS)}&limit=20', None
+
+
+def search_catalog(rng, data):
+    return 'GET /api/search', 'GET', f'/api/search?q={rng.choice(SEARCH_TERMS)}', None
+
+
+def checkout(rng, data):
+    items = [
+        {'product': name, 'quantity': rng.randint(1, 3), 'price': price}
+        for name, price in rng.sample(data['products'], rng.randint(1, 3))
+    ]
+    customer = rng.randrange(data['customers'])
+    body = {
+        'customer': {
+            'name': f'Farmer {customer}',
+            'email': f'farmer{customer}@example.com',
+            'phone': '+91-9000000000',
+            'delivery': 'Benchmark Farm'
+        },
+        'items': items,
+        'total': round(sum(item['quantity'] * item['price'] for item in items), 2)
+    }
+    return 'POST /api/orders', 'POST', '/api/orders', body
+
+
+def order_history(rng, data):
+    return 'GET /api/orders?limit', 'GET', '/api/orders?limit=50', None
+
+
+def view_order(rng, data):
+    return 'GET /api/orders/<id>', 'GET', f'/api/orders/{rng.randint(1, data["max_order_id"])}', None
+
+
+def dashboard(rng, data):
+    return 'GET /api/stats', 'GET', '/api/stats', None
+
+
+# Weighted mix, roughly a storefront: mostly browsing, some checkouts
+WORKLOADS = {
+    'mixed': [
+        (browse_category, 20), (browse_page, 10), (view_product, 25), (search_products, 10),
+        (search_catalog, 5), (checkout, 10), (order_history, 5), (view_order, 10), (dashboard, 5)
+    ],
+    'browse': [(browse_category, 30), (browse_page, 20), (view_product, 50)],
+    'search': [(search_products, 60), (search_catalog, 40)],
+    'checkout': [(checkout, 100)],
+    'dashboard': [(dashboard, 100)]
+}
+
+
+# ---- Clients ----
+
+class TestClient:
+    """In-process requests through Flask's test client"""
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, json=body)
+        response.get_data()
+        return response.status_code
+
+
+class HttpClient:
+    """Keep-alive HTTP connection to a running server"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def request(self, method, path, body):
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status
+
+
+# ---- Runner ----
+
+def load_data(database):
+    """Ids and names the scenarios draw from"""
+    conn = connect(database)
+    data = {
+        'product_ids': [row[0] for row in conn.execute('SELECT id FROM products')],
+        'products': [tuple(row) for row in conn.execute(
+            'SELECT name, price FROM products WHERE stock >= ?', (synthetic_data.BENCHMARK_STOCK // 2,)
+        )],
+        'customers': conn.execute('SELECT COUNT(*) FROM customers').fetchone()[0],
+        'max_order_id': conn.execute('SELECT MAX(id) FROM orders').fetchone()[0] or 1
+    }
+    conn.close()
+    return data
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, rejected, elapsed):
+    """Latency percentiles (ms) and throughput for one endpoint"""
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'rejected': rejected,
+        'throughput_rps': round(len(values) / elapsed, 1),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0
+    }
+
+
+def run(make_client, data, workload, concurrency, total_requests, warmup, seed):
+    """Replay the workload from concurrency threads; return per-endpoint results"""
+    scenarios = [scenario for scenario, weight in WORKLOADS[workload]]
+    weights = [weight for scenario, weight in WORKLOADS[workload]]
+    latencies = {}
+    errors = {}
+    rejected = {}
+    lock = threading.Lock()
+    per_thread = total_requests // concurrency
+
+    def work(thread):
+        rng = random.Random(seed + thread)
+        client = make_client()
+        samples = []
+        failures = []
+        refusals = []
+
+        for n in range(warmup + per_thread):
+            endpoint, method, path, body = rng.choices(scenarios, weights)[0](rng, data)
+            started = time.perf_counter()
+            try:
+                status = client.request(method, path, body)
+            except Exception:
+                status = None
+            latency = time.perf_counter() - started
+
+            if n < warmup:
+                continue
+            if status is None or status >= 500:
+                failures.append(endpoint)
+            elif status >= 400:
+                # Refused (429, 409 out of stock, ...) without doing the work being timed
+                refusals.append(endpoint)
+                continue
+            samples.append((endpoint, latency))
+
+        with lock:
+            for endpoint, latency in samples:
+                latencies.setdefault(endpoint, []).append(latency)
+            for endpoint in failures:
+                errors[endpoint] = errors.get(endpoint, 0) + 1
+            for endpoint in refusals:
+                rejected[endpoint] = rejected.get(endpoint, 0) + 1
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {
+        endpoint: summarize(latencies.get(endpoint, []), errors.get(endpoint, 0), rejected.get(endpoint, 0), elapsed)
+        for endpoint in sorted(set(latencies) | set(errors) | set(rejected))
+    }
+    overall = summarize([v for values in latencies.values() for v in values], sum(errors.values()),
+                        sum(rejected.values()), elapsed)
+    return endpoints, overall, elapsed
+
+
+def git_commit():
+    """Current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(endpoints, overall, baseline=None):
+    """Print the per-endpoint results (with p95 change vs a baseline run)"""
+    header = f"{'endpoint':<30} {'reqs':>6} {'err':>4} {'rej':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    if baseline:
+        header += f" {'p95 vs base':>12}"
+    print(header)
+    print('-' * len(header))
+
+    rows = list(endpoints.items()) + [('ALL', overall)]
+    for endpoint, result in rows:
+        line = (f"{endpoint:<30} {result['requests']:>6} {result['errors']:>4} {result.get('rejected', 0):>5} "
+                f"{result['throughput_rps']:>8.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+        if baseline:
+            previous = baseline['overall'] if endpoint == 'ALL' else baseline['endpoints'].get(endpoint)
+            if previous and previous['p95_ms']:
+                line += f" {(result['p95_ms'] / previous['p95_ms'] - 1) * 100:>+11.1f}%"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay API workloads and report latency percentiles')
+    parser.add_argument('--db', default='bench.db', help='synthetic database (created if missing)')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per thread')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help=f'result file (default: {RESULTS_DIR}/<commit>-<time>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Creating {args.db} ({args.products} products, {args.orders} orders)...")
+        elapsed = synthetic_data.create_database(args.db, args.products, args.customers, args.orders)
+        print(f"Generated in {elapsed:.1f}s")
+
+    app.config['DATABASE'] = args.db
+    data = load_data(args.db)
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        make_client = TestClient
+        rate_limiter.limits = {}   # every thread is the same client
+        concurrency_limiter.limits = {}
+
+    print(f"\nWorkload '{args.workload}': {args.requests} requests, concurrency {args.concurrency}, "
+          f"target {args.url or 'in-process test client'}\n")
+    endpoints, overall, elapsed = run(make_client, data, args.workload, args.concurrency,
+                                      args.requests, args.warmup, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_table(endpoints, overall, baseline)
+    if overall['rejected']:
+        print(f"\n{overall['rejected']} requests were rejected (4xx) and are not in the latencies")
+
+    commit = git_commit()
+    result = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'target': args.url or 'test_client',
+        'config': os.environ['FLASK_CONFIG'],
+        'workload': args.workload,
+        'concurrency': args.concurrency,
+        'database': {
+            'products': len(data['product_ids']),
+            'customers': data['customers'],
+            'orders': data['max_order_id']
+        },
+        'elapsed_s': round(elapsed, 3),
+        'overall': overall,
+        'endpoints': endpoints
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{commit or 'nocommit'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if overall['errors']:
+        sys.exit(1)
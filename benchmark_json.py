@@ -0,0 +1,99 @@
+"""
+JSON response microbenchmark: a 50k-row GET /api/products
+Builds a scratch database with PRODUCTS synthetic products and times the
+parts of the unpaged product list response:
+- building the row dicts: sqlite3.Row -> {name: row[name]} (old) vs plain
+  tuples zipped with the cached column names (new)
+- encoding the payload: stdlib json (Flask's default provider) vs orjson
+- the whole request through the test client, with each encoder
+Each figure is the best of ROUNDS runs.
+
+Usage: python benchmark_json.py [products] [rounds]
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('FLASK_CONFIG', 'production')
+
+from app import app, init_db, catalog_cache, connect_db, PRODUCT_COLUMNS
+import json_provider
+import pagination
+import synthetic_data
+
+
+def best_of(rounds, work):
+    """Fastest of rounds calls of work(), in milliseconds"""
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        work()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000
+
+
+def build_rows(conn, fields, tuples):
+    """Run the product list query and build the row dicts, old or new way"""
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {pagination.select_list(fields, PRODUCT_COLUMNS)} FROM products')
+    if tuples:
+        return pagination.build_page(pagination.fetch_tuples(cursor), fields, None)[0]
+    return [{name: row[name] for name in fields} for row in cursor.fetchall()]
+
+
+def request_products(client):
+    catalog_cache.clear()  # time the route, not a cache hit
+    response = client.get('/api/products')
+    assert response.status_code == 200
+    return response.get_data()
+
+
+if __name__ == '__main__':
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    fields = list(PRODUCT_COLUMNS)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        init_db()
+        conn = connect_db()
+        conn.execute('BEGIN IMMEDIATE')
+        synthetic_data.generate(conn, products=products, customers=0, orders=0)
+        conn.commit()
+
+        stdlib = json_provider.JSONProvider(app, 'stdlib')
+        encoders = [('stdlib', stdlib)]
+        if json_provider.orjson is not None:
+            encoders.append(('orjson', json_provider.JSONProvider(app, 'orjson')))
+
+        payload = {'success': True, 'count': products, 'products': build_rows(conn, fields, True),
+                   'next_cursor': None}
+        size = len(stdlib.encode(payload))
+
+        print(f"\nGET /api/products with {products} products ({size / 1048576:.1f} MB of JSON), "
+              f"best of {rounds}\n")
+        print(f"{'step':<44} {'ms':>9}")
+
+        old_rows = best_of(rounds, lambda: build_rows(conn, fields, False))
+        new_rows = best_of(rounds, lambda: build_rows(conn, fields, True))
+        print(f"{'query + rows, sqlite3.Row -> dict (old)':<44} {old_rows:>9.1f}")
+        print(f"{'query + rows, tuples + cached columns':<44} {new_rows:>9.1f}")
+
+        encoded = {}
+        for name, provider in encoders:
+            encoded[name] = best_of(rounds, lambda: provider.encode(payload))
+            print(f"{'encode, ' + name:<44} {encoded[name]:>9.1f}")
+
+        client = app.test_client()
+        requests = {}
+        for name, provider in encoders:
+            app.json = provider
+            requests[name] = best_of(rounds, lambda: request_products(client))
+            print(f"{'full request, ' + name:<44} {requests[name]:>9.1f}")
+        conn.close()
+
+        fastest = min(encoded, key=encoded.get)
+        before = old_rows + encoded['stdlib']
+        after = new_rows + encoded[fastest]
+        print(f"\nRows + encoding: {before:.1f} ms -> {after:.1f} ms ({before / after:.1f}x faster, {fastest})")
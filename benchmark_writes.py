@@ -0,0 +1,94 @@
+"""
+Write throughput benchmark: per-request transactions vs the single writer
+Builds a scratch database with the current schema and has THREADS threads
+insert products concurrently, first the old way (each thread commits on its
+own connection) and then through writer.WriteQueue (group commit). Runs
+with synchronous=NORMAL (the default config) and synchronous=FULL (one
+fsync per commit).
+
+Usage: python benchmark_writes.py [threads] [writes_per_thread]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+from app import app, init_db
+from database import connect
+from writer import WriteQueue
+
+INSERT_PRODUCT = '''
+    INSERT INTO products (name, category, description, price, size, stock, rating)
+    VALUES (?, 'insecticide', 'Benchmark product', 9.99, '1L Bottle', 10, 4.0)
+'''
+
+
+def run_threads(threads, per_thread, write):
+    """Call write(thread, i) from every thread; return (seconds, errors)"""
+    errors = []
+
+    def work(thread):
+        for i in range(per_thread):
+            try:
+                write(thread, i)
+            except Exception as e:
+                errors.append(str(e))
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, errors
+
+
+def per_request(database, pragmas, threads, per_thread):
+    """Old approach: every request commits its own transaction"""
+    connections = [connect(database, pragmas) for _ in range(threads)]
+
+    def write(thread, i):
+        conn = connections[thread]
+        conn.execute(INSERT_PRODUCT, (f'direct-{thread}-{i}',))
+        conn.commit()
+
+    result = run_threads(threads, per_thread, write)
+    for conn in connections:
+        conn.close()
+    return result, None
+
+
+def single_writer(database, pragmas, threads, per_thread):
+    """New approach: requests queue their work for the single writer"""
+    writer = WriteQueue(lambda: connect(database, pragmas), max_batch=app.config['WRITE_BATCH_SIZE'])
+
+    def write(thread, i):
+        writer.run(lambda cursor: cursor.execute(INSERT_PRODUCT, (f'queued-{thread}-{i}',)))
+
+    result = run_threads(threads, per_thread, write)
+    writer.close()
+    return result, writer.stats()
+
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    total = threads * per_thread
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        init_db()
+
+        print(f"\n{threads} threads x {per_thread} product inserts\n")
+        print(f"{'synchronous':<12} {'approach':<14} {'writes/sec':>11} {'errors':>7} {'avg batch':>10}")
+
+        for synchronous in ('NORMAL', 'FULL'):
+            pragmas = dict(app.config['DB_PRAGMAS'], synchronous=synchronous)
+
+            for name, approach in (('per-request', per_request), ('single writer', single_writer)):
+                (elapsed, errors), stats = approach(app.config['DATABASE'], pragmas, threads, per_thread)
+                batch = f"{stats['jobs'] / stats['batches']:.1f}" if stats else '1.0'
+                print(f"{synchronous:<12} {name:<14} {(total - len(errors)) / elapsed:>11,.0f} {len(errors):>7} {batch:>10}")
@@ -0,0 +1,132 @@
+"""
+In-process response cache for read-heavy catalog routes
+Entries are kept in LRU order with a TTL and tagged with the table they were
+built from; write routes invalidate a tag so the next read sees fresh data.
+With a versions source (TableVersions.get), keys also carry the tag's table
+version, so writes made by other processes or the CLI are picked up as soon
+as the version snapshot moves, the same moment the route's ETag changes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+
+
+class CatalogCache:
+    """Thread-safe TTL + LRU cache of serialized GET responses"""
+
+    def __init__(self, maxsize=1024, ttl=60, versions=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.versions = versions
+        self._entries = OrderedDict()   # key -> (expires_at, tag, body, mimetype)
+        self._generations = {}          # tag -> bumped on every invalidation
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, tag):
+        """Current invalidation generation of a tag"""
+        with self._lock:
+            return self._generations.get(tag, 0)
+
+    def get(self, key):
+        """Return the cached (body, mimetype) for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2], entry[3]
+
+    def set(self, key, tag, body, mimetype, generation):
+        """Store a response unless its tag was invalidated while it was built"""
+        with self._lock:
+            if self._generations.get(tag, 0) != generation:
+                return
+
+            self._entries[key] = (time.monotonic() + self.ttl, tag, body, mimetype)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        """Drop every entry built from the given tables"""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+
+            stale = [key for key, entry in self._entries.items() if entry[1] in tags]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            for tag in list(self._generations):
+                self._generations[tag] += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+    def cached(self, tag, key_func=None):
+        """Decorator caching a view's successful, non-streamed responses
+
+        The default key is the endpoint, its URL arguments and the query
+        string; pass key_func for routes keyed on something else (e.g. a
+        POST body). A key_func returning None bypasses the cache.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if key_func is not None:
+                    key = key_func()
+                else:
+                    key = (request.endpoint, tuple(sorted(kwargs.items())),
+                           tuple(sorted(request.args.items(multi=True))),
+                           request.accept_mimetypes.to_header())
+                if key is None:
+                    return view(*args, **kwargs)
+                if self.versions is not None:
+                    key = (key, self.versions(tag))
+
+                hit = self.get(key)
+                if hit is not None:
+                    return Response(hit[0], mimetype=hit[1])
+
+                generation = self.generation(tag)
+                response = view(*args, **kwargs)
+
+                # Only plain 200 responses are cached, never errors or streams
+                if isinstance(response, Response) and response.status_code == 200 \
+                        and not response.is_streamed:
+                    self.set(key, tag, response.get_data(), response.mimetype, generation)
+
+                return response
+            return wrapper
+        return decorator
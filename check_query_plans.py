@@ -0,0 +1,98 @@
+"""
+Check that the hot API queries are served by indexes
+Builds a scratch database with the current schema + migrations, runs
+EXPLAIN QUERY PLAN on each hot route query and exits non-zero if any of
+them falls back to a full table scan. The queries come from the same
+constants and builders the routes execute, so they can't drift apart.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+import dashboard
+import discounts
+import idempotency
+import inventory
+import multiget
+import order_export
+import orders
+import pricing
+from app import (app, init_db, list_query, orders_list_query, CUSTOMER_BY_EMAIL_QUERY,
+                 CUSTOMER_COLUMNS, ORDER_COLUMNS, PRODUCT_COLUMNS, SERVICE_COLUMNS)
+from database import connect
+
+AFTER = ('2024-01-01 00:00:00', 100)
+LIMIT = 50
+ORDERS_PAGE, ORDERS_PAGE_PARAMS = orders_list_query(['id', 'created_at', 'customer_name'], AFTER, LIMIT)
+EXPORT_WHERE, EXPORT_PARAMS = order_export.date_range('2024-01-01', '2024-01-31')
+
+# (route, query, params), built with the same constants and builders the routes use
+HOT_QUERIES = [
+    ('GET /api/products?category', *list_query('products', list(PRODUCT_COLUMNS), PRODUCT_COLUMNS, None, None,
+                                               ['category = ?'], ['insecticide'])),
+    ('GET /api/products?category&after=', *list_query('products', ['id', 'name'], PRODUCT_COLUMNS, AFTER, LIMIT,
+                                                      ['category = ?'], ['insecticide'])),
+    ('GET /api/services?after=', *list_query('services', ['id', 'name'], SERVICE_COLUMNS, AFTER, LIMIT)),
+    ('POST /api/orders (product lookup)', orders.PRODUCTS_BY_NAME_QUERY.format(placeholders='?, ?'),
+     ('Chlorpyrifos', 'Malathion')),
+    ('POST /api/orders (prices)', pricing.PRICES_QUERY.format(placeholders='?, ?'), (1, 2)),
+    ('POST /api/orders (idempotency key)', idempotency.LOOKUP_QUERY, ('abc',)),
+    ('POST /api/orders (customer lookup)', CUSTOMER_BY_EMAIL_QUERY, ('a@b.c',)),
+    ('GET /api/orders', *orders_list_query(list(ORDER_COLUMNS), None, None)),
+    ('GET /api/orders?after=', ORDERS_PAGE, ORDERS_PAGE_PARAMS),
+    ('GET /api/customers?after=', *list_query('customers', ['id', 'name'], CUSTOMER_COLUMNS, AFTER, LIMIT)),
+    ('GET /api/orders/export', order_export.export_query(list(order_export.EXPORT_COLUMNS), EXPORT_WHERE),
+     EXPORT_PARAMS),
+    ('GET /api/orders/batch (orders)', multiget.ORDER_HEADER_QUERY.format(placeholders='?, ?, ?'), (1, 2, 3)),
+    ('GET /api/orders/<id> (items)', multiget.ORDER_ITEMS_QUERY.format(order_ids='?'), (1,)),
+    ('GET /api/orders/batch (items)', multiget.ORDER_ITEMS_QUERY.format(order_ids='?, ?, ?'), (1, 2, 3)),
+    ('GET /api/orders?expand=items (items)', multiget.ORDER_ITEMS_QUERY.format(order_ids=f'SELECT id FROM ({ORDERS_PAGE})'),
+     ORDERS_PAGE_PARAMS),
+    ('GET /api/stats (recent orders)', dashboard.RECENT_ORDERS_QUERY, ()),
+    ('GET /api/stats (low stock)', dashboard.LOW_STOCK_QUERY, (dashboard.LOW_STOCK_THRESHOLD,)),
+    ('POST /api/orders (reservation)', inventory.RESERVATION_QUERY, ('abc', 1e9)),
+    ('Stock ledger flush (other holds)', inventory.OTHER_HOLDS_QUERY, (1e9, 'abc')),
+    ('Stock ledger flush (own holds)', inventory.OWN_HOLDS_QUERY, ('abc',)),
+    ('POST /api/orders (discount redemption)', discounts.REDEEM_QUERY, ('SAVE10',))
+]
+
+def full_scans(conn, query, params):
+    """Return the plan lines that scan a whole table without an index"""
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+    # Scanning a materialized (already LIMITed) subquery is not a table scan
+    subqueries = {row[3].split()[1] for row in plan if row[3].startswith('MATERIALIZE')}
+    return [row[3] for row in plan
+            if row[3].startswith('SCAN') and 'INDEX' not in row[3]
+            and row[3].split()[1] not in subqueries]
+
+
+def check_query_plans(database):
+    """Print the plan status of every hot query, return the failures"""
+    conn = connect(database)
+    failures = []
+
+    for route, query, params in HOT_QUERIES:
+        scans = full_scans(conn, query, params)
+        if scans:
+            failures.append(route)
+            print(f"✗ {route}: {'; '.join(scans)}")
+        else:
+            print(f"✓ {route}")
+
+    conn.close()
+    return failures
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'plans.db')
+        init_db()
+        failures = check_query_plans(app.config['DATABASE'])
+
+    if failures:
+        print(f"\n{len(failures)} hot queries fall back to a full table scan")
+        sys.exit(1)
+
+    print("\nAll hot queries use an index")
@@ -0,0 +1,98 @@
+"""
+Checks for the token bucket stores behind rate limiting (see rate_limit.py)
+Runs the same checks against MemoryStore and, when fakeredis is installed,
+against RedisStore on an in-memory stand-in for a Redis server, and exits
+non-zero if one fails:
+- a full bucket allows burst requests, then refuses with a retry delay
+- tokens come back at the configured rate
+- concurrent takes never hand out more tokens than the bucket holds
+- (Redis) two stores on the same server share one bucket, like two workers
+
+Usage: python check_rate_limit.py
+"""
+import sys
+import threading
+import time
+
+import rate_limit
+
+
+def check_burst(store, name):
+    """burst allowed, then refused with about 1/rate to wait"""
+    failures = []
+    results = [store.take(f'{name}:burst', 2.0, 5) for _ in range(6)]
+    if [allowed for allowed, _, _ in results] != [True] * 5 + [False]:
+        failures.append(f'{name}: burst of 5 gave {[allowed for allowed, _, _ in results]}')
+    retry_after = results[-1][2]
+    if not 0.3 <= retry_after <= 0.5:
+        failures.append(f'{name}: retry after {retry_after:.3f}s, expected about 0.5s')
+    return failures
+
+
+def check_refill(store, name, wait):
+    """An empty bucket at 20/s has about 20 * elapsed tokens again"""
+    for _ in range(3):
+        store.take(f'{name}:refill', 20.0, 3)
+    wait(0.2)
+    allowed = sum(store.take(f'{name}:refill', 20.0, 3)[0] for _ in range(5))
+    if allowed != 3:
+        return [f'{name}: {allowed} requests allowed after refilling, expected 3 (the burst)']
+    return []
+
+
+def check_concurrency(stores, name, threads=16):
+    """Threads (and stores) racing for one bucket of 50 that barely refills"""
+    allowed = []
+    lock = threading.Lock()
+
+    def worker(n):
+        store = stores[n % len(stores)]
+        granted = sum(store.take(f'{name}:race', 0.001, 50)[0] for _ in range(20))
+        with lock:
+            allowed.append(granted)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    if sum(allowed) != 50:
+        return [f'{name}: {sum(allowed)} of {threads * 20} racing requests allowed, expected 50']
+    return []
+
+
+def check_store(name, make_store, wait, shared):
+    """All checks on one store; shared stores also race through a second instance"""
+    store = make_store()
+    failures = check_burst(store, name)
+    failures += check_refill(store, name, wait)
+    failures += check_concurrency([store, make_store()] if shared else [store], name)
+    print(f"{name}: {'ok' if not failures else 'FAILED'}")
+    return failures
+
+
+if __name__ == '__main__':
+    now = [1000.0]
+
+    def advance(seconds):
+        now[0] += seconds
+
+    # Buckets in memory are per process, so a second MemoryStore doesn't share them
+    failures = check_store('memory', lambda: rate_limit.MemoryStore(clock=lambda: now[0]), advance, False)
+
+    try:
+        import fakeredis
+    except ImportError:  # optional: memory store only
+        fakeredis = None
+        print('redis: skipped (pip install fakeredis lupa)')
+    if fakeredis is not None:
+        server = fakeredis.FakeServer()
+        failures += check_store('redis', lambda: rate_limit.RedisStore(fakeredis.FakeRedis(server=server)),
+                                time.sleep, True)
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('\nRate limit stores behave')
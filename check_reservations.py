@@ -0,0 +1,267 @@
+"""
+Concurrency checks for stock reservations (see inventory.py)
+Hammers the stock ledger and the checkout routes from many threads and
+exits non-zero if an invariant breaks:
+- ledger: holds never promise units a serialized "database" no longer has,
+  even when stock is read before other threads confirm
+- routes: concurrent reservations and orders never oversell a product, and
+  products.stock always equals the starting stock minus the units ordered
+- expiry and cross-process holds: a second ledger sees the first one's
+  holds after a flush, and expired holds give their units back
+- forked workers: ledgers forked from one preloaded app get their own
+  owner, so each worker counts the others' holds
+
+Usage: python check_reservations.py [threads]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+from app import app, init_db, connect_db, rate_limiter, stock_ledger
+from database import close_pool, close_writer, get_writer
+import database
+import inventory
+
+STOCK = 40
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def check_ledger(threads, rounds=300):
+    """Holds against a simulated, serialized products.stock"""
+    ledger = inventory.StockLedger()
+    db = {'stock': 500}
+    db_lock = threading.Lock()   # stands in for the single writer
+    failures = []
+
+    def worker(n):
+        rng = random.Random(n)
+        for i in range(rounds):
+            quantity = rng.randint(1, 4)
+            mark = ledger.mark()
+            stock = db['stock']          # read outside the writer, may be stale by the time we hold
+            if rng.random() < 0.5:
+                time.sleep(0.0002)           # widen the window for a confirm to slip in
+            hold, _ = ledger.hold(f'{n}-{i}', {1: quantity}, {1: stock}, mark, 60)
+            if hold is None:
+                continue
+            if rng.random() < 0.7:
+                with db_lock:
+                    if db['stock'] < quantity:
+                        failures.append(f'held {quantity} with only {db["stock"]} in stock')
+                    else:
+                        db['stock'] -= quantity
+                        ledger.confirm(hold.id)
+            else:
+                ledger.release(hold.id)
+
+    run_threads(threads, worker)
+    stats = ledger.stats()
+    if stats['active'] or stats['held_units']:
+        failures.append(f'holds left over: {stats}')
+    print(f"ledger: {stats['holds']} holds, {stats['confirmed']} confirmed, "
+          f"{stats['rejected']} refused, stock left {db['stock']}")
+    return failures
+
+
+def check_routes(threads, product_id):
+    """Reserve-then-order and direct orders racing for one product"""
+    statuses = {}
+    ordered = []
+    failures = []
+    lock = threading.Lock()
+
+    def worker(n):
+        client = app.test_client()
+        rng = random.Random(n)
+        for i in range(6):
+            quantity = rng.randint(1, 3)
+            items = [{'product': 'Ledger Test', 'quantity': quantity, 'price': 1.0}]
+            order = {'customer': {'name': 'T', 'email': f'{n}@example.com', 'phone': '1', 'delivery': 'x'},
+                     'items': items, 'total': quantity}
+            if rng.random() < 0.5:
+                reserved = client.post('/api/reservations', json={'items': items})
+                with lock:
+                    statuses[reserved.status_code] = statuses.get(reserved.status_code, 0) + 1
+                if reserved.status_code != 201:
+                    continue
+                order['reservation_id'] = reserved.get_json()['reservation_id']
+            response = client.post('/api/orders', json=order)
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 201:
+                    ordered.append(quantity)
+                elif response.status_code != 409:
+                    failures.append(f'{response.status_code} {response.get_data(as_text=True)}')
+            if response.status_code != 201 and 'reservation_id' in order:
+                client.delete(f"/api/reservations/{order['reservation_id']}")
+
+    run_threads(threads, worker)
+
+    conn = connect_db()
+    stock = conn.execute('SELECT stock FROM products WHERE id = ?', (product_id,)).fetchone()[0]
+    items = conn.execute('SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = ?',
+                         (product_id,)).fetchone()[0]
+    conn.close()
+    if stock < 0:
+        failures.append(f'stock went negative: {stock}')
+    if stock != STOCK - sum(ordered) or items != sum(ordered):
+        failures.append(f'stock {stock}, ordered {sum(ordered)}, order items {items}')
+    if stock_ledger.stats()['held_units']:
+        failures.append(f'holds left over: {stock_ledger.stats()}')
+    print(f'routes: responses {dict(sorted(statuses.items()))}, {sum(ordered)} of {STOCK} units ordered')
+    return failures
+
+
+def check_processes(product_id):
+    """Two ledgers sharing the database, with expiry on a fake clock"""
+    now = [1e9]
+    first = inventory.StockLedger(clock=lambda: now[0])
+    second = inventory.StockLedger(clock=lambda: now[0])
+    writer = get_writer(app)
+    failures = []
+
+    conn = connect_db()
+    conn.execute('UPDATE products SET stock = ? WHERE id = ?', (STOCK, product_id))
+    conn.commit()
+    conn.close()
+
+    held, _ = first.hold('a', {product_id: 30}, {product_id: STOCK}, first.mark(), 60)
+    first.flush(writer)
+    second.flush(writer)
+    if second.available(product_id, STOCK) != 10:
+        failures.append(f'second process sees {second.available(product_id, STOCK)} available, expected 10')
+    if second.hold('b', {product_id: 11}, {product_id: STOCK}, second.mark(), 60)[0] is not None:
+        failures.append('second process oversold held units')
+
+    # A flushed reservation can be claimed through the other process, once
+    def claim(cursor):
+        inventory.claim(cursor, 'a', None, {product_id: 30}, now[0])
+    writer.run(claim)
+    try:
+        writer.run(lambda cursor: inventory.claim(cursor, 'a', first.get('a'), {product_id: 30}, now[0]))
+        failures.append('reservation claimed twice')
+    except inventory.ReservationError:
+        pass
+    first.flush(writer)
+    if first.stats()['active']:
+        failures.append('claimed hold still held by its owner')
+
+    # Expiry gives units back everywhere
+    first.hold('c', {product_id: 25}, {product_id: STOCK}, first.mark(), 60)
+    first.flush(writer)
+    second.flush(writer)
+    now[0] += 61
+    first.flush(writer)
+    second.flush(writer)
+    if second.hold('d', {product_id: STOCK}, {product_id: STOCK}, second.mark(), 60)[0] is None:
+        failures.append('expired hold still counted')
+
+    print(f'processes: first {first.stats()}, second {second.stats()}')
+    return failures
+
+
+def in_child(work):
+    """Run work() in a forked process, like a gunicorn worker of a preloaded app; returns its result"""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        status = 0
+        try:
+            # As serve.py's post_fork: no pooled connections or writer from the parent
+            database.close_pool(app)
+            app.extensions.pop('db_writer', None)
+            result = work()
+            close_writer(app)
+        except Exception as e:
+            result, status = repr(e), 1
+        with os.fdopen(write_end, 'w') as f:
+            json.dump(result, f)
+        os._exit(status)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        result = json.load(f)
+    os.waitpid(pid, 0)
+    return result
+
+
+def check_forks():
+    """Two workers forked after the app-level ledger was created"""
+    conn = connect_db()
+    product_id = conn.execute('''
+        INSERT INTO products (name, category, price, stock) VALUES ('Fork Test', 'test', 1.0, ?)
+    ''', (STOCK,)).lastrowid
+    conn.commit()
+    conn.close()
+    failures = []
+
+    def first_worker():
+        hold, _ = stock_ledger.hold('fork-a', {product_id: 30}, {product_id: STOCK}, stock_ledger.mark(), 60)
+        stock_ledger.flush(get_writer(app))
+        return {'owner': stock_ledger.owner, 'held': hold is not None}
+
+    def second_worker():
+        stock_ledger.flush(get_writer(app))
+        hold, _ = stock_ledger.hold('fork-b', {product_id: 11}, {product_id: STOCK}, stock_ledger.mark(), 60)
+        return {'owner': stock_ledger.owner, 'held': hold is not None,
+                'available': stock_ledger.available(product_id, STOCK)}
+
+    first = in_child(first_worker)
+    second = in_child(second_worker)
+    if not isinstance(first, dict) or not isinstance(second, dict):
+        return [f'forked worker failed: {first} / {second}']
+
+    owners = {stock_ledger.owner, first['owner'], second['owner']}
+    if len(owners) != 3:
+        failures.append('forked workers share a ledger owner')
+    if not first['held']:
+        failures.append('first worker could not hold')
+    if second['held'] or second['available'] != STOCK - 30:
+        failures.append(f"second worker ignored the first one's hold: {second}")
+    print(f"forks: {len(owners)} distinct owners, second worker sees {second['available']} available")
+    return failures
+
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    rate_limiter.limits = {}   # every thread is the same client
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'reservations.db')
+        init_db()
+        conn = connect_db()
+        product_id = conn.execute('''
+            INSERT INTO products (name, category, price, stock) VALUES ('Ledger Test', 'test', 1.0, ?)
+        ''', (STOCK,)).lastrowid
+        conn.commit()
+        conn.close()
+
+        # Before any writer or flush thread exists in this process
+        failures = check_forks()
+        failures += check_ledger(threads)
+        failures += check_routes(threads, product_id)
+        failures += check_processes(product_id)
+
+        stock_ledger.close()
+        close_writer(app)
+        close_pool(app)
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('\nReservations hold up under concurrency')
@@ -0,0 +1,165 @@
+"""
+Negotiated response compression (gzip, and brotli when installed)
+Responses of a text type at least COMPRESS_MIN_SIZE bytes long are
+compressed with the best encoding the client accepts, at the level set in
+COMPRESS_LEVELS. Streamed responses (NDJSON lists, exports) are compressed
+chunk by chunk and flushed after every chunk, so clients still receive rows
+as they are produced.
+
+The catalog routes in COMPRESS_PRECOMPRESSED answer with an ETag derived
+from the table versions (see versions.py). Their compressed bodies are kept
+in a PrecompressedCache keyed by that ETag, so a payload is compressed once
+per catalog change instead of once per request. An entry is only reused for
+the exact body it was compressed from, so it can never outlive the data
+behind it. Compressed responses carry a weak ETag, as the bytes differ from
+the uncompressed representation.
+"""
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Preferred first when the client accepts both equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'
+}
+
+
+def compress(body, encoding, level):
+    """Compress a whole body"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress an iterable of byte chunks, flushing after each one"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class PrecompressedCache:
+    """Thread-safe LRU of compressed bodies keyed by (ETag, encoding), bounded in bytes"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # (etag, encoding) -> (uncompressed body, compressed body)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag, encoding, source):
+        """Compressed body for source, if it was stored under this ETag from the same bytes"""
+        with self._lock:
+            entry = self._entries.get((etag, encoding))
+            # Identity first: catalog cache hits hand back the very same bytes object
+            if entry is None or (entry[0] is not source and entry[0] != source):
+                self.misses += 1
+                return None
+            self._entries.move_to_end((etag, encoding))
+            self.hits += 1
+            return entry[1]
+
+    def set(self, etag, encoding, source, body):
+        size = len(source) + len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((etag, encoding), None)
+            if previous is not None:
+                self._size -= len(previous[0]) + len(previous[1])
+            self._entries[(etag, encoding)] = (source, body)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0]) + len(evicted[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def negotiate(request):
+    """Best encoding the client accepts, or None"""
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compress_response(request, response, config, precompressed=None):
+    """Compress a finished response in place if it is worth it and the client accepts it"""
+    if response.status_code < 200 or response.status_code in (204, 206, 304) \
+            or request.method == 'HEAD' \
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES \
+            or 'Content-Encoding' in response.headers \
+            or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return response
+
+    streamed = response.is_streamed
+    if not streamed and response.calculate_content_length() < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    # The body depends on Accept-Encoding from here on, whatever this client sent
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request)
+    if encoding is None:
+        return response
+    level = config['COMPRESS_LEVELS'][encoding]
+
+    if streamed:
+        chunks = response.response
+        response.response = compress_stream(chunks, encoding, level)
+        if hasattr(chunks, 'close'):
+            response.call_on_close(chunks.close)
+        response.headers.pop('Content-Length', None)
+    else:
+        etag, weak = response.get_etag()
+        body = None
+        cacheable = precompressed is not None and etag is not None \
+            and request.endpoint in config['COMPRESS_PRECOMPRESSED']
+        source = response.get_data()
+        if cacheable:
+            body = precompressed.get(etag, encoding, source)
+        if body is None:
+            body = compress(source, encoding, level)
+            if cacheable:
+                precompressed.set(etag, encoding, source, body)
+        response.set_data(body)
+
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+
+    response.headers['Content-Encoding'] = encoding
+    return response
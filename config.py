@@ -5,6 +5,118 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     DATABASE = 'agrichem.db'
     
+    # Connection pool (see database.py)
+    DB_POOL_SIZE = 8
+    DB_TIMEOUT = 5.0
+    DB_PRAGMAS = {
+        'journal_mode': 'WAL',       # readers don't block the writer
+        'synchronous': 'NORMAL',     # safe with WAL, avoids an fsync per commit
+        'cache_size': -16000,        # negative = KiB, ~16MB page cache
+        'mmap_size': 134217728,      # 128MB memory-mapped reads
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    }
+    
+    # Most queued write requests the single writer commits in one
+    # transaction (see writer.py)
+    WRITE_BATCH_SIZE = 64
+    
+    # Rows per transaction for bulk product imports (see product_import.py)
+    IMPORT_CHUNK_ROWS = 5000
+    
+    # Rows per chunk (fetchmany / columnar block) for order exports (see order_export.py)
+    EXPORT_CHUNK_ROWS = 5000
+    
+    # Rows per fetchmany() chunk for streamed (NDJSON) list responses
+    STREAM_CHUNK_ROWS = 500
+    
+    # JSON encoder for responses: 'auto' (orjson if installed, else the
+    # standard library), 'orjson' or 'stdlib' (see json_provider.py)
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+    
+    # Response compression (see compression.py): smallest body worth
+    # compressing, level per encoding (gzip 1-9, brotli 0-11), the catalog
+    # routes whose compressed payloads are kept per table version, and the
+    # memory those may use
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVELS = {'gzip': 6, 'br': 5}
+    COMPRESS_PRECOMPRESSED = ('get_products', 'get_product', 'get_services', 'search')
+    COMPRESS_CACHE_BYTES = 64 * 1024 * 1024
+    
+    # Token buckets per client and endpoint: (requests per second, burst).
+    # Endpoints not listed are not rate limited (see rate_limit.py)
+    RATE_LIMITS = {
+        'search': (10, 30),
+        'create_order': (2, 10),
+        'create_reservation': (2, 10),
+        'book_service': (1, 5),
+        'validate_discount': (2, 10),
+        'add_product': (5, 20),
+        'update_product': (5, 20),
+        'delete_product': (5, 20),
+        'import_products': (0.1, 2),
+        'export_orders': (0.2, 2)
+    }
+    # Where the buckets live: unset/'memory://' = per process, or a
+    # redis:// URL to share them between workers and hosts
+    RATE_LIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL')
+    # Request header naming the client (e.g. 'X-Forwarded-For' behind a
+    # trusted proxy). Unset = the peer address
+    RATE_LIMIT_CLIENT_HEADER = os.environ.get('RATE_LIMIT_CLIENT_HEADER')
+    
+    # Load shedding: most requests in flight per endpoint and process, and
+    # most writes waiting for the single writer, before new ones get a 503
+    CONCURRENCY_LIMITS = {
+        'search': 16,
+        'export_orders': 2,
+        'import_products': 1
+    }
+    MAX_PENDING_WRITES = 256
+    
+    # Stock reservations (see inventory.py): default and longest hold in
+    # seconds, and how often the in-memory ledger expires holds and
+    # flushes them to SQLite
+    RESERVATION_TTL_SECONDS = 900
+    RESERVATION_MAX_TTL_SECONDS = 3600
+    RESERVATION_FLUSH_SECONDS = 1.0
+    
+    # In-process catalog response cache (see cache.py)
+    CATALOG_CACHE_SIZE = 1024
+    CATALOG_CACHE_TTL = 60
+    
+    # Conditional GET: how often (seconds) table versions are re-read from SQLite,
+    # and the Cache-Control header per endpoint (see versions.py)
+    TABLE_VERSION_REFRESH = 1.0
+    CACHE_CONTROL = {
+        'default': 'no-cache',
+        'get_products': 'public, no-cache',
+        'get_product': 'public, no-cache',
+        'get_services': 'public, max-age=60',
+        'search': 'public, no-cache',
+        'get_statistics': 'private, no-cache',
+        'get_customers': 'private, no-cache',
+        'get_customer': 'private, no-cache',
+        'get_orders': 'private, no-cache',
+        'get_orders_batch': 'private, no-cache',
+        'get_order': 'private, no-cache'
+    }
+    
+    # How long Idempotency-Key responses for POST /api/orders are kept
+    IDEMPOTENCY_KEY_TTL_HOURS = 24
+    
+    # Worker id (0-999) embedded in order numbers; give each server process or
+    # host its own. Unset = derived from the process id (see order_numbers.py)
+    ORDER_WORKER_ID = os.environ.get('ORDER_WORKER_ID')
+    
+    # Log statements slower than this many milliseconds, with their query
+    # plan (see metrics.py). Unset = off
+    SLOW_QUERY_MS = float(os.environ['SLOW_QUERY_MS']) if os.environ.get('SLOW_QUERY_MS') else None
+    
+    # Async (ASGI) mode, see asgi.py: threads running the routes (and
+    # producing streamed chunks), and largest accepted request body
+    ASYNC_WORKERS = 8
+    ASYNC_MAX_BODY_BYTES = 16 * 1024 * 1024
+    
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
@@ -14,12 +126,25 @@ class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    
+    # Production server (see serve.py)
+    SERVER_HOST = os.environ.get('HOST', '0.0.0.0')
+    SERVER_PORT = int(os.environ.get('PORT', 5000))
+    SERVER_WORKERS = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+    SERVER_KEEPALIVE = 5            # seconds an idle keep-alive connection stays open
+    SERVER_TIMEOUT = 30             # seconds before a stuck worker is restarted
+    SERVER_GRACEFUL_TIMEOUT = 30    # seconds in-flight requests get on shutdown
+    SERVER_BACKLOG = 2048
+    DB_POOL_SIZE = 32
+    DB_PRAGMAS = dict(Config.DB_PRAGMAS, cache_size=-64000, mmap_size=268435456)
 
 class TestingConfig(Config):
     """Testing configuration"""
     DEBUG = True
     TESTING = True
     DATABASE = 'test_agrichem.db'
+    DB_POOL_SIZE = 2
 
 # Configuration dictionary
 config = {
@@ -0,0 +1,98 @@
+"""
+Materialized dashboard statistics for /api/stats
+The totals live in the dashboard_stats table and are kept current by
+triggers on orders, customers and products (see migrations.py), so reading
+them is a single primary-key lookup however many orders exist. The last
+computed payload is also kept in memory and reused until one of the
+underlying tables changes version.
+"""
+import threading
+
+LOW_STOCK_THRESHOLD = 50
+RECENT_ORDERS = 5
+
+# Both are index range scans bounded by their result size. The LIMIT sits in
+# a subquery so the planner can't start from customers and sort every order
+# (which it prefers once ANALYZE has run)
+RECENT_ORDERS_QUERY = f'''
+    SELECT o.id, o.order_number, o.total_amount, o.status, o.created_at, c.name
+    FROM (
+        SELECT id, order_number, total_amount, status, created_at, customer_id
+        FROM orders
+        ORDER BY created_at DESC
+        LIMIT {RECENT_ORDERS}
+    ) o
+    JOIN customers c ON o.customer_id = c.id
+    ORDER BY o.created_at DESC
+'''
+LOW_STOCK_QUERY = 'SELECT * FROM products WHERE stock < ? ORDER BY stock ASC'
+
+# Recomputes every counter from the base tables
+REBUILD_STATEMENTS = [
+    'DELETE FROM dashboard_stats',
+    '''
+        INSERT INTO dashboard_stats (key, value)
+        SELECT 'total_orders', COUNT(*) FROM orders
+        UNION ALL
+        SELECT 'total_revenue', COALESCE(SUM(total_amount), 0) FROM orders WHERE status != 'cancelled'
+        UNION ALL
+        SELECT 'total_customers', COUNT(*) FROM customers
+        UNION ALL
+        SELECT 'total_products', COUNT(*) FROM products
+    '''
+]
+
+
+def rebuild(conn):
+    """Recompute the materialized totals from scratch (caller commits)"""
+    for statement in REBUILD_STATEMENTS:
+        conn.execute(statement)
+
+
+def compute(cursor):
+    """Build the /api/stats payload from the materialized totals"""
+    cursor.execute('SELECT key, value FROM dashboard_stats')
+    totals = {key: value for key, value in cursor.fetchall()}
+
+    cursor.execute(RECENT_ORDERS_QUERY)
+    recent_orders = [dict(row) for row in cursor.fetchall()]
+
+    cursor.execute(LOW_STOCK_QUERY, (LOW_STOCK_THRESHOLD,))
+    low_stock = [dict(row) for row in cursor.fetchall()]
+
+    return {
+        'total_orders': int(totals.get('total_orders', 0)),
+        'total_revenue': round(totals.get('total_revenue', 0) or 0, 2),
+        'total_customers': int(totals.get('total_customers', 0)),
+        'total_products': int(totals.get('total_products', 0)),
+        'recent_orders': recent_orders,
+        'low_stock_products': low_stock
+    }
+
+
+class DashboardSnapshot:
+    """Last computed statistics, valid while the table versions are unchanged"""
+
+    def __init__(self):
+        self._versions = None
+        self._statistics = None
+        self._lock = threading.Lock()
+
+    def get(self, cursor, versions):
+        """Return the statistics for these table versions, computing if needed"""
+        with self._lock:
+            if self._versions == versions:
+                return self._statistics
+
+        statistics = compute(cursor)
+
+        with self._lock:
+            self._versions = versions
+            self._statistics = statistics
+        return statistics
+
+    def clear(self):
+        """Forget the snapshot (e.g. after a rebuild)"""
+        with self._lock:
+            self._versions = None
+            self._statistics = None
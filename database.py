@@ -0,0 +1,155 @@
+"""
+SQLite connection management for AgriChem Solutions API
+Connections are pooled and bound to the Flask app context, so a request
+reuses an already-open, already-tuned connection instead of reconnecting.
+Writes go through a single writer connection instead (see writer.py).
+"""
+import sqlite3
+import threading
+
+from flask import current_app, g
+
+from metrics import ProfiledConnection
+from writer import WriteQueue
+
+# Guards the lazy start of the writer thread
+_writer_lock = threading.Lock()
+
+
+def connect(database, pragmas=None, timeout=5.0):
+    """Open a new SQLite connection with the configured pragmas applied"""
+    conn = sqlite3.connect(database, timeout=timeout, check_same_thread=False, factory=ProfiledConnection)
+    conn.row_factory = sqlite3.Row
+
+    for name, value in (pragmas or {}).items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared by the worker threads"""
+
+    def __init__(self, database, size=8, pragmas=None, timeout=5.0):
+        self.database = database
+        self.size = size
+        self.pragmas = pragmas or {}
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._lock = threading.Condition()
+
+    def acquire(self):
+        """Take an idle connection, opening a new one while under the limit"""
+        with self._lock:
+            while not self._idle and self._open >= self.size:
+                if not self._lock.wait(self.timeout):
+                    raise sqlite3.OperationalError('Timed out waiting for a database connection')
+
+            if self._idle:
+                return self._idle.pop()
+
+            self._open += 1
+
+        try:
+            return connect(self.database, self.pragmas, self.timeout)
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection - drop it instead of handing it out again
+            conn.close()
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            return
+
+        with self._lock:
+            self._idle.append(conn)
+            self._lock.notify()
+
+    def close_all(self):
+        """Close every idle connection held by the pool"""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+                self._open -= 1
+
+
+def get_pool(app=None):
+    """Get (or lazily create) the connection pool for the Flask app"""
+    app = app or current_app
+    pool = app.extensions.get('db_pool')
+
+    if pool is None:
+        pool = ConnectionPool(
+            app.config['DATABASE'],
+            size=app.config['DB_POOL_SIZE'],
+            pragmas=app.config['DB_PRAGMAS'],
+            timeout=app.config['DB_TIMEOUT']
+        )
+        app.extensions['db_pool'] = pool
+
+    return pool
+
+
+def close_pool(app):
+    """Close all pooled connections, e.g. before swapping the database file"""
+    pool = app.extensions.pop('db_pool', None)
+    if pool is not None:
+        pool.close_all()
+
+
+def get_writer(app=None):
+    """Get (or lazily start) the single writer for the Flask app
+
+    A writer whose thread has died is replaced rather than failing every
+    later write until a restart.
+    """
+    app = app or current_app
+    with _writer_lock:
+        writer = app.extensions.get('db_writer')
+
+        if writer is None or not writer.is_alive():
+            config = app.config
+            writer = WriteQueue(
+                lambda: connect(config['DATABASE'], config['DB_PRAGMAS'], config['DB_TIMEOUT']),
+                max_batch=config['WRITE_BATCH_SIZE']
+            )
+            app.extensions['db_writer'] = writer
+
+    return writer
+
+
+def close_writer(app):
+    """Stop the writer after its queued work, e.g. before swapping the database file"""
+    writer = app.extensions.pop('db_writer', None)
+    if writer is not None:
+        writer.close()
+
+
+def get_db():
+    """Get the connection bound to the current app context"""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def release_db(exception=None):
+    """Hand the app context's connection back to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+def init_app(app):
+    """Register connection pooling with the Flask app"""
+    app.teardown_appcontext(release_db)
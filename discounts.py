@@ -0,0 +1,148 @@
+"""
+Discount code engine
+All active codes are compiled into an in-memory map (code -> DiscountRule)
+and reloaded only when the discount_rules counter in table_versions moves,
+which a trigger bumps whenever a code or one of its rules changes (see
+migrations.py). Validating a code is a dict lookup and a few comparisons:
+/api/discount/validate takes the version from the in-memory TableVersions
+snapshot, while an order reads it in its own transaction (a primary key
+lookup), so a rule changed by any process applies to the next order.
+
+A rule can limit a code to a time window (starts_at / expires_at, UTC), to
+max_uses redemptions, to carts of at least min_order_value, and to the
+products of one category (the discount then only applies to those lines).
+Redemptions are counted with one guarded UPDATE in the order's own
+transaction, which stays correct across server processes; the in-memory
+count is refreshed from it on every redemption.
+"""
+import calendar
+import threading
+import time
+from datetime import datetime
+
+from pricing import money, to_decimal
+
+# Columns added to discount_codes for the rules (see migrations.py)
+RULE_COLUMNS = {
+    'starts_at': 'TIMESTAMP',
+    'expires_at': 'TIMESTAMP',
+    'max_uses': 'INTEGER',
+    'times_used': 'INTEGER NOT NULL DEFAULT 0',
+    'min_order_value': 'REAL NOT NULL DEFAULT 0',
+    'category': 'TEXT'
+}
+
+# Counts one use, unless the code is inactive or used up
+REDEEM_QUERY = '''
+    UPDATE discount_codes SET times_used = times_used + 1
+    WHERE code = ? AND active = 1 AND (max_uses IS NULL OR times_used < max_uses)
+    RETURNING times_used
+'''
+
+
+class DiscountError(Exception):
+    """The code can't be applied (unknown, expired, used up, or the cart doesn't qualify)"""
+
+
+def parse_timestamp(value):
+    """Epoch seconds for a TIMESTAMP column value (UTC), or None"""
+    if value is None:
+        return None
+    return calendar.timegm(datetime.fromisoformat(value).timetuple())
+
+
+class DiscountRule:
+    """One compiled discount code"""
+
+    __slots__ = ('code', 'percentage', 'starts_at', 'expires_at', 'max_uses', 'used',
+                 'min_order_value', 'category')
+
+    def __init__(self, row):
+        self.code = row['code']
+        self.percentage = to_decimal(row['discount_percentage'])
+        self.starts_at = parse_timestamp(row['starts_at'])
+        self.expires_at = parse_timestamp(row['expires_at'])
+        self.max_uses = row['max_uses']
+        self.used = row['times_used']
+        self.min_order_value = to_decimal(row['min_order_value'])
+        self.category = row['category']
+
+    def check_code(self, now):
+        """Raise DiscountError if the code can't be used at all right now"""
+        if self.starts_at is not None and now < self.starts_at:
+            raise DiscountError('Discount code is not active yet')
+        if self.expires_at is not None and now >= self.expires_at:
+            raise DiscountError('Discount code has expired')
+        if self.max_uses is not None and self.used >= self.max_uses:
+            raise DiscountError('Discount code has been fully redeemed')
+
+    def discount(self, subtotal, by_category):
+        """Discount for a cart given its subtotal per category; raises DiscountError if it doesn't qualify"""
+        if subtotal < self.min_order_value:
+            raise DiscountError(f'Discount code needs an order of at least {self.min_order_value:.2f}')
+
+        base = subtotal
+        if self.category is not None:
+            base = by_category.get(self.category)
+            if base is None:
+                raise DiscountError(f'Discount code only applies to {self.category} products')
+        return money(base * self.percentage / 100)
+
+    def to_dict(self):
+        return {
+            'code': self.code,
+            'discount_percentage': float(self.percentage),
+            'expires_at': None if self.expires_at is None else
+                time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.expires_at)),
+            'remaining_uses': None if self.max_uses is None else max(0, self.max_uses - self.used),
+            'min_order_value': float(self.min_order_value),
+            'category': self.category
+        }
+
+
+class DiscountEngine:
+    """Active discount codes compiled in memory, reloaded per rules version"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._rules = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def load(self, cursor, version):
+        """Compile the active codes if the discount_rules version moved since the last load"""
+        if version == self._version:
+            return
+        cursor.execute(f'''
+            SELECT code, discount_percentage, {', '.join(RULE_COLUMNS)}
+            FROM discount_codes
+            WHERE active = 1
+        ''')
+        rows = cursor.fetchall()
+        rules = {row['code']: DiscountRule(row) for row in rows}
+        with self._lock:
+            self._rules, self._version = rules, version
+            self.reloads += 1
+
+    def rule(self, code):
+        """The usable rule for a code, or raise DiscountError"""
+        rule = self._rules.get(code.strip().upper()) if isinstance(code, str) else None
+        if rule is None:
+            raise DiscountError('Invalid or expired discount code')
+        rule.check_code(self.clock())
+        return rule
+
+    def redeem(self, cursor, rule):
+        """Count one use inside the order's transaction; raises DiscountError if it's used up"""
+        cursor.execute(REDEEM_QUERY, (rule.code,))
+        row = cursor.fetchone()
+        if row is None:
+            raise DiscountError('Discount code has been fully redeemed')
+        with self._lock:
+            rule.used = max(rule.used, row[0])
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return {'codes': len(self._rules), 'version': self._version, 'reloads': self.reloads}
@@ -0,0 +1,57 @@
+"""
+Idempotency-Key support for POST routes
+The first successful response for a key is stored in the same transaction
+as the write it describes; retries with the same key and body get that
+response back instead of repeating the write.
+"""
+import hashlib
+import json
+
+MAX_KEY_LENGTH = 255
+
+LOOKUP_QUERY = '''
+    SELECT request_hash, status_code, response
+    FROM idempotency_keys
+    WHERE key = ?
+'''
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different body"""
+
+
+def fingerprint(body):
+    """Hash of the raw request body"""
+    return hashlib.sha256(body or b'').hexdigest()
+
+
+def validate_key(key):
+    """Reject empty or oversized keys"""
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f'Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters')
+    return key
+
+
+def lookup(cursor, key, request_hash):
+    """Return the stored (payload, status_code) for a key, or None"""
+    cursor.execute(LOOKUP_QUERY, (key,))
+    row = cursor.fetchone()
+
+    if row is None:
+        return None
+    if row['request_hash'] != request_hash:
+        raise IdempotencyKeyReused('Idempotency-Key was already used with a different request')
+
+    return json.loads(row['response']), row['status_code']
+
+
+def store(cursor, key, request_hash, payload, status_code, ttl_hours=24):
+    """Record the response for a key and prune expired keys"""
+    cursor.execute(
+        "DELETE FROM idempotency_keys WHERE created_at < datetime('now', ?)",
+        (f'-{int(ttl_hours)} hours',)
+    )
+    cursor.execute('''
+        INSERT INTO idempotency_keys (key, request_hash, status_code, response)
+        VALUES (?, ?, ?, ?)
+    ''', (key, request_hash, status_code, json.dumps(payload)))
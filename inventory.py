@@ -0,0 +1,351 @@
+"""
+Stock reservations for checkout
+A reservation holds units of one or more products for a limited time (hold
+on checkout). Placing the order with its reservation_id confirms it, which
+takes the units out of products.stock; releasing it or letting it expire
+gives them back. Orders placed without a reservation take a short-lived
+hold of their own, so they can't take units someone else is holding.
+
+Holds live in a StockLedger in process memory: the check-and-hold on the
+checkout path is a few dict operations under one in-process lock and never
+waits on SQLite. Available units = products.stock - units held here - units
+held by other processes. Every RESERVATION_FLUSH_SECONDS the ledger expires
+old holds and flushes the rest to the stock_reservations table through the
+single writer, which is also how processes learn about each other's holds.
+products.stock only changes when a reservation is confirmed, in the order's
+own transaction, and the guarded UPDATE there (see orders.py) stays the
+final check against overselling.
+"""
+import heapq
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from orders import InsufficientStockError, parse_quantity, resolve_lines
+
+# Hold taken by an order placed without a reservation (seconds)
+ORDER_HOLD_SECONDS = 60
+
+# Unexpired rows of one reservation, flushed by any process
+RESERVATION_QUERY = '''
+    SELECT product_id, quantity FROM stock_reservations
+    WHERE id = ? AND expires_at > ?
+'''
+# Holds this process flushed, and the units other processes hold per product
+OWN_HOLDS_QUERY = 'SELECT DISTINCT id FROM stock_reservations WHERE owner = ?'
+OTHER_HOLDS_QUERY = '''
+    SELECT product_id, SUM(quantity) FROM stock_reservations
+    WHERE expires_at > ? AND owner != ?
+    GROUP BY product_id
+'''
+
+
+class ReservationError(Exception):
+    """The reservation is unknown, expired or doesn't match the cart"""
+
+
+class Hold:
+    """Units of each product held by one reservation"""
+
+    __slots__ = ('id', 'quantities', 'expires_at', 'flushed')
+
+    def __init__(self, reservation_id, quantities, expires_at):
+        self.id = reservation_id
+        self.quantities = quantities   # product id -> units
+        self.expires_at = expires_at
+        self.flushed = False           # written to stock_reservations
+
+
+class StockLedger:
+    """In-memory holds per product, flushed to SQLite periodically"""
+
+    # Recent confirmations kept to correct stock read just before a hold
+    CONFIRM_LOG_SIZE = 4096
+
+    def __init__(self, owner=None, clock=time.time):
+        self._configured_owner = owner
+        self.clock = clock
+        self._reset()
+
+        # A forked worker (preload_app) must not pass for the parent: other
+        # processes' holds are told apart by owner, and the parent's holds
+        # and flush thread don't belong to the child
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """(Re)start with no holds, under a fresh owner for this process"""
+        self.owner = self._configured_owner or uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._holds = {}        # reservation id -> Hold
+        self._held = {}         # product id -> units held by this process
+        self._remote = {}       # product id -> units held by other processes (last flush)
+        self._expiry = []       # heap of (expires_at, reservation id)
+        self._ended = set()     # flushed reservations released/confirmed/expired since
+        self._confirms = deque(maxlen=self.CONFIRM_LOG_SIZE)   # (seq, product id, units)
+        self._seq = 0
+        self._flusher = None
+        self._stop = threading.Event()
+        self.counts = {'holds': 0, 'rejected': 0, 'confirmed': 0, 'released': 0,
+                       'expired': 0, 'flushes': 0, 'flush_errors': 0}
+
+    def mark(self):
+        """Position in the confirmation log; take it before reading products.stock"""
+        return self._seq
+
+    def available(self, product_id, stock):
+        """Units of a product not held anywhere, given its products.stock (lock-free)"""
+        return (stock or 0) - self._held.get(product_id, 0) - self._remote.get(product_id, 0)
+
+    def hold(self, reservation_id, quantities, stock, mark, ttl):
+        """Hold units if all of them are available; returns (Hold, []) or (None, shortages)
+
+        stock maps product id -> products.stock as read after mark(). Units
+        confirmed here since then are already gone from products.stock but
+        may not be in that read, so they are subtracted too.
+        """
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+
+            recent = {}
+            for seq, product_id, quantity in reversed(self._confirms):
+                if seq <= mark:
+                    break
+                recent[product_id] = recent.get(product_id, 0) + quantity
+
+            shortages = []
+            for product_id, quantity in quantities.items():
+                available = self.available(product_id, stock[product_id]) - recent.get(product_id, 0)
+                if quantity > available:
+                    shortages.append((product_id, quantity, max(available, 0)))
+            if shortages:
+                self.counts['rejected'] += 1
+                return None, shortages
+
+            hold = Hold(reservation_id, dict(quantities), now + ttl)
+            self._holds[reservation_id] = hold
+            for product_id, quantity in quantities.items():
+                self._held[product_id] = self._held.get(product_id, 0) + quantity
+            heapq.heappush(self._expiry, (hold.expires_at, reservation_id))
+            self.counts['holds'] += 1
+            return hold, []
+
+    def get(self, reservation_id):
+        """The live Hold for a reservation made in this process, or None"""
+        hold = self._holds.get(reservation_id)
+        if hold is None or hold.expires_at <= self.clock():
+            return None
+        return hold
+
+    def release(self, reservation_id):
+        """Give the held units back; False if there was no such hold"""
+        with self._lock:
+            hold = self._drop(reservation_id)
+            if hold is not None:
+                self.counts['released'] += 1
+            return hold is not None
+
+    def confirm(self, reservation_id):
+        """End a hold whose units were just taken out of products.stock; returns the Hold or None"""
+        with self._lock:
+            hold = self._drop(reservation_id)
+            if hold is None:
+                return None
+            for product_id, quantity in hold.quantities.items():
+                self._seq += 1
+                self._confirms.append((self._seq, product_id, quantity))
+            self.counts['confirmed'] += 1
+            return hold
+
+    def restore(self, hold):
+        """Put back a confirmed hold whose order was rolled back after all
+
+        Its entries stay in the confirmation log: they can only make a
+        concurrent hold see fewer units, never more.
+        """
+        with self._lock:
+            if hold.id in self._holds:
+                return
+            self._holds[hold.id] = hold
+            for product_id, quantity in hold.quantities.items():
+                self._held[product_id] = self._held.get(product_id, 0) + quantity
+            heapq.heappush(self._expiry, (hold.expires_at, hold.id))
+            self._ended.discard(hold.id)
+            self.counts['confirmed'] -= 1
+
+    def expire(self):
+        """Release every hold past its expiry; returns how many"""
+        with self._lock:
+            return self._expire(self.clock())
+
+    def _expire(self, now):
+        expired = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            _, reservation_id = heapq.heappop(self._expiry)
+            if self._drop(reservation_id) is not None:
+                expired += 1
+        self.counts['expired'] += expired
+        return expired
+
+    def _drop(self, reservation_id):
+        hold = self._holds.pop(reservation_id, None)
+        if hold is None:
+            return None
+        for product_id, quantity in hold.quantities.items():
+            left = self._held[product_id] - quantity
+            if left:
+                self._held[product_id] = left
+            else:
+                del self._held[product_id]
+        if hold.flushed:
+            self._ended.add(reservation_id)
+        return hold
+
+    def flush(self, writer):
+        """Expire holds, write the ledger to stock_reservations and read other processes' holds"""
+        captured = {}
+
+        def write(cursor):
+            # Runs on the writer thread, so order transactions see holds and rows change together
+            now = self.clock()
+            with self._lock:
+                self._expire(now)
+                # A restored hold may still be listed as ended; its row must stay
+                ended = {rid for rid in self._ended if rid not in self._holds}
+                self._ended = set()
+                new = [hold for hold in self._holds.values() if not hold.flushed]
+                for hold in new:
+                    hold.flushed = True
+            captured.update(ended=ended, new=new)
+
+            cursor.executemany('DELETE FROM stock_reservations WHERE id = ?',
+                               [(reservation_id,) for reservation_id in ended])
+            cursor.executemany('''
+                INSERT OR REPLACE INTO stock_reservations (id, product_id, quantity, expires_at, owner)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(hold.id, product_id, quantity, hold.expires_at, self.owner)
+                  for hold in new for product_id, quantity in hold.quantities.items()])
+            cursor.execute('DELETE FROM stock_reservations WHERE expires_at <= ?', (now,))
+
+            # Flushed holds whose rows are gone were released or ordered through another process
+            cursor.execute(OWN_HOLDS_QUERY, (self.owner,))
+            stored = {row[0] for row in cursor.fetchall()}
+            with self._lock:
+                for reservation_id in [hold.id for hold in self._holds.values()
+                                       if hold.flushed and hold.id not in stored]:
+                    self._drop(reservation_id)
+                    self.counts['released'] += 1
+
+            cursor.execute(OTHER_HOLDS_QUERY, (now, self.owner))
+            return dict(cursor.fetchall())
+
+        try:
+            remote = writer.run(write)
+        except Exception:
+            # Not written after all: try again on the next flush
+            with self._lock:
+                for hold in captured.get('new', ()):
+                    hold.flushed = False
+                self._ended |= captured.get('ended', set())
+                self.counts['flush_errors'] += 1
+            raise
+
+        with self._lock:
+            self._remote = remote
+            self.counts['flushes'] += 1
+
+    def start(self, get_writer, interval):
+        """Flush every interval seconds on a background thread (once per ledger)"""
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._run, args=(get_writer, interval), name='stock-ledger', daemon=True
+            )
+            self._flusher.start()
+
+    def _run(self, get_writer, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush(get_writer())
+            except Exception:
+                pass  # counted in flush_errors, retried next time
+
+    def close(self):
+        """Stop the background flush"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return dict(
+                self.counts,
+                active=len(self._holds),
+                held_units=sum(self._held.values()),
+                remote_units=sum(self._remote.values())
+            )
+
+
+def parse_ttl(value, default, maximum):
+    """Validate a hold duration in seconds (whole number, 1..maximum)"""
+    if value is None:
+        return default
+    ttl = parse_quantity(value)
+    if ttl > maximum:
+        raise ValueError(f'ttl must be at most {maximum} seconds')
+    return ttl
+
+
+def reserve(ledger, cursor, items, ttl, reservation_id=None):
+    """Resolve cart items and hold their units; returns (Hold, order lines)
+
+    Raises InsufficientStockError with the shortages if any product lacks
+    available units.
+    """
+    mark = ledger.mark()
+    lines, stock = resolve_lines(cursor, items)
+    if not lines:
+        raise ValueError('None of the items is a known product')
+
+    quantities = {}
+    names = {}
+    for line in lines:
+        quantities[line['product_id']] = quantities.get(line['product_id'], 0) + line['quantity']
+        names[line['product_id']] = line['name']
+
+    hold, shortages = ledger.hold(reservation_id or uuid.uuid4().hex, quantities, stock, mark, ttl)
+    if hold is None:
+        raise InsufficientStockError([
+            {'product': names[product_id], 'requested': requested, 'available': available}
+            for product_id, requested, available in shortages
+        ])
+    return hold, lines
+
+
+def load(cursor, reservation_id, now):
+    """Quantities of an unexpired reservation flushed by any process, or None"""
+    cursor.execute(RESERVATION_QUERY, (reservation_id, now))
+    rows = cursor.fetchall()
+    return {row[0]: row[1] for row in rows} or None
+
+
+def claim(cursor, reservation_id, hold, quantities, now):
+    """Consume a reservation inside the order's write transaction
+
+    hold is this process's Hold for it, if any. A hold that has been flushed
+    must still have its rows, so one reservation can't be confirmed twice by
+    different processes.
+    """
+    flushed = load(cursor, reservation_id, now)
+    cursor.execute('DELETE FROM stock_reservations WHERE id = ?', (reservation_id,))
+
+    reserved = hold.quantities if hold is not None and not hold.flushed else flushed
+    if reserved is None:
+        raise ReservationError('Reservation not found or expired')
+    if reserved != quantities:
+        raise ReservationError('Cart does not match the reservation')
@@ -0,0 +1,59 @@
+"""
+JSON encoding for API responses
+A Flask JSON provider that encodes with orjson when it is installed and
+with the standard library otherwise (JSON_ENCODER: 'auto', 'orjson' or
+'stdlib'). Both produce the same documents: keys sorted, compact outside
+debug mode, and values JSON has no type for (dates, Decimal, UUID) passed
+through Flask's default conversion. orjson writes non-ASCII text as UTF-8
+rather than \\u escapes. Request bodies are still parsed by the stdlib.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used instead
+    orjson = None
+
+ENCODERS = ('auto', 'orjson', 'stdlib')
+
+if orjson is not None:
+    # Dates go through Flask's default (HTTP date strings), as with the stdlib
+    ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def pick_encoder(choice):
+    """Resolve the JSON_ENCODER setting to the encoder that will be used"""
+    if choice not in ENCODERS:
+        raise ValueError(f"JSON_ENCODER must be one of: {', '.join(ENCODERS)}")
+    if choice == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_ENCODER is orjson but orjson is not installed')
+    return 'orjson' if choice != 'stdlib' and orjson is not None else 'stdlib'
+
+
+class JSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with a pluggable (fast when available) encoder"""
+
+    def __init__(self, app, encoder='auto'):
+        super().__init__(app)
+        self.encoder = pick_encoder(encoder)
+
+    def encode(self, obj, indent=False):
+        """Serialize obj to UTF-8 JSON bytes"""
+        if self.encoder == 'orjson':
+            options = ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else ORJSON_OPTIONS
+            return orjson.dumps(obj, default=self.default, option=options)
+        if indent:
+            return super().dumps(obj, indent=2).encode('utf-8')
+        return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        # Anything beyond formatting options needs the stdlib's json.dumps
+        if self.encoder == 'stdlib' or set(kwargs) - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj, kwargs.get('indent') is not None).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        """jsonify(): encode straight to bytes, without a str round trip"""
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.encode(obj, indent) + b'\n', mimetype=self.mimetype)
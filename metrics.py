@@ -0,0 +1,257 @@
+"""
+Request and SQL metrics for AgriChem Solutions API
+Every request records its latency, response size, and the number and total
+time of the SQL statements it ran. Pooled connections are ProfiledConnections:
+a trace callback counts every statement (including the ones triggers run)
+and their cursors time execute/fetch calls. The aggregated histograms are
+exposed at /api/metrics in the Prometheus text format.
+
+Statements slower than SLOW_QUERY_MS (off by default) are logged together
+with their EXPLAIN QUERY PLAN.
+"""
+import sqlite3
+import threading
+import time
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Stats of the request running on this thread
+_current = threading.local()
+
+
+class RequestStats:
+    """SQL activity of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.timed = []  # [sql, params, seconds] per cursor execute
+
+    def add_time(self, entry, seconds):
+        entry[2] += seconds
+        self.sql_seconds += seconds
+
+
+def current():
+    """Stats of the request on this thread, or None outside a request"""
+    return getattr(_current, 'stats', None)
+
+
+def bind(work):
+    """Wrap work(cursor) so it is charged to this thread's request wherever it runs"""
+    stats = current()
+
+    def run(cursor):
+        _current.stats = stats
+        if stats is not None:
+            cursor.connection.set_trace_callback(_trace)
+        try:
+            return work(cursor)
+        finally:
+            _current.stats = None
+            cursor.connection.set_trace_callback(None)
+
+    return run
+
+
+def _trace(statement):
+    stats = current()
+    if stats is not None:
+        stats.statements += 1
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that charges execute and fetch time to the current request"""
+
+    _entry = None
+
+    def _timed(self, method, *args):
+        stats = current()
+        if stats is None or self._entry is None:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            stats.add_time(self._entry, time.perf_counter() - started)
+
+    def _start(self, method, sql, parameters):
+        stats = current()
+        if stats is None:
+            self._entry = None
+            return method(sql, parameters)
+        self._entry = [sql, parameters, 0.0]
+        stats.timed.append(self._entry)
+        return self._timed(method, sql, parameters)
+
+    def execute(self, sql, parameters=()):
+        return self._start(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._start(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose statements are counted and timed per request"""
+
+    def cursor(self, factory=ProfiledCursor):
+        # Only trace while a request is being measured: the callback also
+        # fires for trigger and FTS statements, which adds up in bulk writes
+        # (conn.execute() goes through here too)
+        self.set_trace_callback(_trace if current() is not None else None)
+        return super().cursor(factory)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Per-endpoint request and SQL metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}        # (endpoint, method, status) -> count
+        self.latency = {}         # (endpoint, method) -> Histogram
+        self.response_size = {}   # (endpoint,) -> Histogram
+        self.sql_statements = {}  # (endpoint,) -> Histogram
+        self.sql_time = {}        # (endpoint,) -> Histogram
+        self.slow_queries = {}    # (endpoint,) -> count
+
+    def start_request(self):
+        """Begin collecting SQL stats for the request on this thread"""
+        _current.stats = RequestStats()
+
+    def finish_request(self, endpoint, method, status, size):
+        """Record a finished request; returns its stats (None if not started)"""
+        stats = current()
+        _current.stats = None
+        if stats is None:
+            return None
+
+        elapsed = time.perf_counter() - stats.started
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._histogram(self.latency, (endpoint, method), LATENCY_BUCKETS).observe(elapsed)
+            if size is not None:
+                self._histogram(self.response_size, (endpoint,), SIZE_BUCKETS).observe(size)
+            self._histogram(self.sql_statements, (endpoint,), COUNT_BUCKETS).observe(stats.statements)
+            self._histogram(self.sql_time, (endpoint,), LATENCY_BUCKETS).observe(stats.sql_seconds)
+        return stats
+
+    def count_slow_query(self, endpoint):
+        with self._lock:
+            self.slow_queries[(endpoint,)] = self.slow_queries.get((endpoint,), 0) + 1
+
+    def _histogram(self, family, key, buckets):
+        histogram = family.get(key)
+        if histogram is None:
+            histogram = family[key] = Histogram(buckets)
+        return histogram
+
+    def render(self, extra=None):
+        """Prometheus text exposition of every metric, plus extra {name: (type, help, value)}"""
+        lines = []
+        with self._lock:
+            _counter(lines, 'agrichem_http_requests_total', 'Requests by endpoint, method and status',
+                     ('endpoint', 'method', 'status'), self.requests)
+            _histograms(lines, 'agrichem_http_request_duration_seconds', 'Request latency',
+                        ('endpoint', 'method'), self.latency)
+            _histograms(lines, 'agrichem_http_response_size_bytes', 'Response body size (non-streamed)',
+                        ('endpoint',), self.response_size)
+            _histograms(lines, 'agrichem_sql_statements_per_request', 'SQL statements run per request',
+                        ('endpoint',), self.sql_statements)
+            _histograms(lines, 'agrichem_sql_duration_seconds', 'Time spent in SQL per request',
+                        ('endpoint',), self.sql_time)
+            _counter(lines, 'agrichem_slow_queries_total', 'Statements over the slow query threshold',
+                     ('endpoint',), self.slow_queries)
+
+        for name, (metric_type, help_text, value) in sorted((extra or {}).items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _counter(lines, name, help_text, label_names, values):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} counter')
+    for key, value in sorted(values.items()):
+        lines.append(f'{name}{_labels(label_names, key)} {value}')
+
+
+def _histograms(lines, name, help_text, label_names, family):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for key, histogram in sorted(family.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f'{name}_bucket{_labels(label_names, key, le)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(label_names, key)} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{_labels(label_names, key)} {histogram.count}')
+
+
+def explain_slow_queries(get_conn, stats, threshold_ms):
+    """(sql, params, ms, plan lines) for the request's statements over the threshold
+
+    get_conn is only called if a SELECT was slow, so fast requests don't
+    take a connection for it.
+    """
+    slow = []
+    conn = None
+    for sql, params, seconds in stats.timed:
+        if seconds * 1000 < threshold_ms:
+            continue
+        plan = []
+        if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            conn = conn or get_conn()
+            try:
+                plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            except sqlite3.Error as e:
+                plan = [f'(plan unavailable: {e})']
+        slow.append((' '.join(sql.split()), params, round(seconds * 1000, 2), plan))
+    return slow
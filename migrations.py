@@ -0,0 +1,308 @@
+"""
+Versioned schema migrations for agrichem.db
+The applied version is tracked with PRAGMA user_version, so each migration
+runs exactly once per database file, on new and existing databases alike.
+"""
+import dashboard
+import discounts
+
+# Full-text index over the product and service catalog. The FTS rowid encodes
+# the source row (products: id * 2, services: id * 2 + 1) so the sync triggers
+# can update/delete by rowid instead of scanning the index.
+CATALOG_FTS_SCHEMA = [
+    '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5(
+            name,
+            description,
+            kind UNINDEXED,
+            ref_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''',
+    '''
+        INSERT INTO catalog_fts (rowid, name, description, kind, ref_id)
+        SELECT id * 2, name, description, 'product', id FROM products
+        UNION ALL
+        SELECT id * 2 + 1, name, description, 'service', id FROM services
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO catalog_fts (rowid, name, description, kind, ref_id)
+            VALUES (new.id * 2, new.name, new.description, 'product', new.id);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products BEGIN
+            UPDATE catalog_fts SET name = new.name, description = new.description
+            WHERE rowid = old.id * 2;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            DELETE FROM catalog_fts WHERE rowid = old.id * 2;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS services_fts_insert AFTER INSERT ON services BEGIN
+            INSERT INTO catalog_fts (rowid, name, description, kind, ref_id)
+            VALUES (new.id * 2 + 1, new.name, new.description, 'service', new.id);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS services_fts_update AFTER UPDATE OF name, description ON services BEGIN
+            UPDATE catalog_fts SET name = new.name, description = new.description
+            WHERE rowid = old.id * 2 + 1;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS services_fts_delete AFTER DELETE ON services BEGIN
+            DELETE FROM catalog_fts WHERE rowid = old.id * 2 + 1;
+        END
+    '''
+]
+
+
+def fts5_available(conn):
+    """Check whether this SQLite build has the FTS5 extension compiled in"""
+    options = [row[0] for row in conn.execute('PRAGMA compile_options')]
+    return 'ENABLE_FTS5' in options
+
+
+def create_catalog_fts(conn):
+    """Create and populate the catalog full-text index if FTS5 is available"""
+    if not fts5_available(conn):
+        print("FTS5 not available - search will use LIKE matching")
+        return
+
+    for statement in CATALOG_FTS_SCHEMA:
+        conn.execute(statement)
+
+
+# Tables whose writes bump their row in table_versions (ETag source, see versions.py)
+VERSIONED_TABLES = (
+    'products', 'services', 'customers', 'orders', 'order_items',
+    'service_bookings', 'discount_codes'
+)
+
+
+def create_table_versions(conn):
+    """Create the table_versions counters and the triggers that bump them"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+    for table in VERSIONED_TABLES:
+        conn.execute('INSERT OR IGNORE INTO table_versions (name) VALUES (?)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            ''')
+
+
+def create_price_version(conn):
+    """Add a product_prices counter, bumped only when a price actually changes"""
+    conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES ('product_prices')")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS product_prices_version_update
+        AFTER UPDATE OF price ON products WHEN OLD.price IS NOT NEW.price BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'product_prices';
+        END
+    ''')
+
+
+def add_discount_rules(conn):
+    """Add the rule columns to discount_codes and a discount_rules counter for reloading them"""
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(discount_codes)')}
+    for column, definition in discounts.RULE_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE discount_codes ADD COLUMN {column} {definition}')
+
+    # Redemptions (times_used) don't count as a rule change
+    conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES ('discount_rules')")
+    rule_columns = ', '.join(['code', 'discount_percentage', 'active'] +
+                             [column for column in discounts.RULE_COLUMNS if column != 'times_used'])
+    for event in ('INSERT', 'DELETE', f'UPDATE OF {rule_columns}'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS discount_rules_version_{event.split()[0].lower()}
+            AFTER {event} ON discount_codes BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'discount_rules';
+            END
+        ''')
+
+
+# Incrementally maintained totals behind /api/stats (see dashboard.py)
+DASHBOARD_STATS_SCHEMA = [
+    '''
+        CREATE TABLE IF NOT EXISTS dashboard_stats (
+            key TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_insert AFTER INSERT ON orders BEGIN
+            UPDATE dashboard_stats SET value = value + 1 WHERE key = 'total_orders';
+            UPDATE dashboard_stats
+            SET value = value + (CASE WHEN new.status != 'cancelled' THEN new.total_amount ELSE 0 END)
+            WHERE key = 'total_revenue';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_update AFTER UPDATE OF status, total_amount ON orders BEGIN
+            UPDATE dashboard_stats
+            SET value = value
+                - (CASE WHEN old.status != 'cancelled' THEN old.total_amount ELSE 0 END)
+                + (CASE WHEN new.status != 'cancelled' THEN new.total_amount ELSE 0 END)
+            WHERE key = 'total_revenue';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_delete AFTER DELETE ON orders BEGIN
+            UPDATE dashboard_stats SET value = value - 1 WHERE key = 'total_orders';
+            UPDATE dashboard_stats
+            SET value = value - (CASE WHEN old.status != 'cancelled' THEN old.total_amount ELSE 0 END)
+            WHERE key = 'total_revenue';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS customers_stats_insert AFTER INSERT ON customers BEGIN
+            UPDATE dashboard_stats SET value = value + 1 WHERE key = 'total_customers';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS customers_stats_delete AFTER DELETE ON customers BEGIN
+            UPDATE dashboard_stats SET value = value - 1 WHERE key = 'total_customers';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS products_stats_insert AFTER INSERT ON products BEGIN
+            UPDATE dashboard_stats SET value = value + 1 WHERE key = 'total_products';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS products_stats_delete AFTER DELETE ON products BEGIN
+            UPDATE dashboard_stats SET value = value - 1 WHERE key = 'total_products';
+        END
+    '''
+]
+
+
+def create_dashboard_stats(conn):
+    """Create the dashboard totals and fill them from the existing rows"""
+    for statement in DASHBOARD_STATS_SCHEMA:
+        conn.execute(statement)
+    dashboard.rebuild(conn)
+
+
+# (version, description, steps) - append new migrations, never edit old ones.
+# A step is either an SQL statement or a callable taking the connection.
+MIGRATIONS = [
+    (1, 'Secondary indexes for hot queries', [
+        'CREATE INDEX IF NOT EXISTS idx_products_category ON products (category)',
+        'CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)',
+        'CREATE INDEX IF NOT EXISTS idx_products_stock ON products (stock)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders (customer_id)',
+        'CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_service_bookings_customer_id ON service_bookings (customer_id)'
+    ]),
+    (2, 'Full-text search index for products and services', [
+        create_catalog_fts
+    ]),
+    (3, 'Keyset pagination indexes on created_at', [
+        'CREATE INDEX IF NOT EXISTS idx_products_created_at ON products (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_services_created_at ON services (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_customers_created_at ON customers (created_at)'
+    ]),
+    (4, 'Per-table version counters for ETags', [
+        create_table_versions
+    ]),
+    (5, 'Idempotency keys for order creation', [
+        '''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                request_hash TEXT NOT NULL,
+                status_code INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at)'
+    ]),
+    (6, 'Materialized dashboard statistics', [
+        create_dashboard_stats
+    ]),
+    (7, 'Stock reservations flushed from the in-memory ledger', [
+        '''
+            CREATE TABLE IF NOT EXISTS stock_reservations (
+                id TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                owner TEXT NOT NULL,
+                PRIMARY KEY (id, product_id)
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_stock_reservations_expires_at ON stock_reservations (expires_at)',
+        'CREATE INDEX IF NOT EXISTS idx_stock_reservations_owner ON stock_reservations (owner)'
+    ]),
+    (8, 'Price version counter for server-side order pricing', [
+        create_price_version
+    ]),
+    (9, 'Discount code rules (window, usage cap, minimum order, category)', [
+        add_discount_rules
+    ]),
+    (10, 'Database epoch shared by every process serving the file', [
+        # Random per database file, so ETags match across workers and change
+        # when the database is recreated
+        "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('epoch', abs(random()))"
+    ])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    """Get the schema version recorded in the database file"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply all pending migrations, each in its own transaction
+
+    Safe to run from several processes at once: each migration takes the
+    write lock and re-checks the version before applying.
+    """
+    applied = []
+
+    for version, description, steps in MIGRATIONS:
+        if version <= get_version(conn):
+            continue
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if version <= get_version(conn):
+                # Another process applied it while we waited for the lock
+                conn.execute('ROLLBACK')
+                continue
+
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        applied.append(version)
+        print(f"Applied migration {version}: {description}")
+
+    return applied
@@ -0,0 +1,86 @@
+"""
+Multi-get lookups: many rows by id in a fixed number of queries
+Clients that need several products or orders send one request with an id
+list instead of one request per id. Each table is read with a single
+IN (...) query, and the items of all the requested orders come from one
+query, grouped per order in a single pass. The same items query embeds
+items into a page of GET /api/orders (expand=items), with the page query
+itself as the IN (...) window.
+"""
+
+# Most ids per request (keeps every IN list well under SQLite's variable limit)
+MAX_IDS = 500
+
+ORDER_HEADER_QUERY = '''
+    SELECT o.*, c.name as customer_name, c.email as customer_email, c.phone as customer_phone
+    FROM orders o
+    JOIN customers c ON o.customer_id = c.id
+    WHERE o.id IN ({placeholders})
+'''
+
+ORDER_ITEMS_QUERY = '''
+    SELECT oi.*, p.name as product_name, p.category
+    FROM order_items oi
+    JOIN products p ON oi.product_id = p.id
+    WHERE oi.order_id IN ({order_ids})
+'''
+
+
+def parse_ids(value):
+    """Parse a comma separated ids= list; duplicates are dropped, order is kept"""
+    ids = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            ids.append(int(part))
+        except ValueError:
+            raise ValueError(f'Invalid id: {part!r}')
+
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValueError('ids must list at least one id')
+    if len(ids) > MAX_IDS:
+        raise ValueError(f'At most {MAX_IDS} ids per request')
+    return ids
+
+
+def placeholders(values):
+    return ', '.join('?' * len(values))
+
+
+def keyed(rows, ids, key='id'):
+    """Map id -> row in request order, plus the ids that weren't found"""
+    found = {row[key]: row for row in rows}
+    return {row_id: found[row_id] for row_id in ids if row_id in found}, [
+        row_id for row_id in ids if row_id not in found
+    ]
+
+
+def embed_items(cursor, orders, order_ids, params=()):
+    """Give every order in the id -> order map its items list, with one query
+
+    order_ids is the SQL inside IN (...): placeholders for params, or a
+    subquery selecting the ids of a page of orders. Items are appended in a
+    single pass over the result; ids outside the map are skipped.
+    """
+    for order in orders.values():
+        order['items'] = []
+    if not orders:
+        return
+
+    cursor.execute(ORDER_ITEMS_QUERY.format(order_ids=order_ids), params)
+    for row in cursor.fetchall():
+        order = orders.get(row['order_id'])
+        if order is not None:
+            order['items'].append(dict(row))
+
+
+def fetch_orders(cursor, ids):
+    """Orders with their customer and items, as (id -> order, missing ids), in two queries"""
+    cursor.execute(ORDER_HEADER_QUERY.format(placeholders=placeholders(ids)), ids)
+    orders, missing = keyed([dict(row) for row in cursor.fetchall()], ids)
+
+    embed_items(cursor, orders, placeholders(orders), list(orders))
+    return orders, missing
@@ -0,0 +1,197 @@
+"""
+Streaming order export for accounting
+One row per order item, joined with its order, customer and product, for
+the orders created in a date range. The rows come straight off an index
+walk of orders.created_at (no sort), are fetched in chunks and written out
+chunk by chunk, so memory stays flat however many orders are exported.
+
+The export runs on its own connection inside a single read transaction:
+with WAL it sees one consistent snapshot of the database from the first
+row to the last, and checkout keeps writing while it runs.
+
+Two output formats:
+- csv: a header line, then one line per row
+- columnar: newline-delimited JSON; a schema line, then one line per chunk
+  holding each column as a list. String columns are dictionary-encoded per
+  chunk ({"dictionary": [...], "indices": [...]}), which collapses the
+  order and customer values repeated on every item line. read_columnar()
+  turns it back into rows.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+# Name -> (SQL expression, type), in output order
+EXPORT_COLUMNS = {
+    'order_id': ('o.id', 'integer'),
+    'order_number': ('o.order_number', 'string'),
+    'created_at': ('o.created_at', 'string'),
+    'status': ('o.status', 'string'),
+    'total_amount': ('o.total_amount', 'double'),
+    'discount_code': ('o.discount_code', 'string'),
+    'discount_amount': ('o.discount_amount', 'double'),
+    'delivery_address': ('o.delivery_address', 'string'),
+    'customer_id': ('c.id', 'integer'),
+    'customer_name': ('c.name', 'string'),
+    'customer_email': ('c.email', 'string'),
+    'customer_phone': ('c.phone', 'string'),
+    'product_id': ('oi.product_id', 'integer'),
+    'product_name': ('p.name', 'string'),
+    'category': ('p.category', 'string'),
+    'quantity': ('oi.quantity', 'integer'),
+    'unit_price': ('oi.price', 'double')
+}
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'columnar': ('application/x-ndjson', 'jsonl')
+}
+
+COLUMNAR_VERSION = 1
+
+
+def parse_time(value, name):
+    """Parse a date or date-time bound into a naive UTC datetime (and whether it had a time)"""
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f'{name} must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+
+    # created_at is CURRENT_TIMESTAMP, i.e. UTC without an offset
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed, len(value.strip()) > 10
+
+
+def date_range(since=None, until=None):
+    """WHERE conditions (and params) for orders created from since to until, both inclusive"""
+    conditions = []
+    params = []
+
+    if since:
+        start, _ = parse_time(since, 'from')
+        conditions.append('o.created_at >= ?')
+        params.append(start.strftime('%Y-%m-%d %H:%M:%S'))
+
+    if until:
+        end, has_time = parse_time(until, 'to')
+        if has_time:
+            conditions.append('o.created_at <= ?')
+        else:
+            # A bare date includes that whole day
+            end += timedelta(days=1)
+            conditions.append('o.created_at < ?')
+        params.append(end.strftime('%Y-%m-%d %H:%M:%S'))
+
+    return conditions, params
+
+
+def export_query(fields, conditions):
+    """SELECT for the export; ordered by the created_at index so SQLite never sorts"""
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'''
+        SELECT {', '.join(EXPORT_COLUMNS[name][0] for name in fields)}
+        FROM orders o
+        JOIN customers c ON c.id = o.customer_id
+        LEFT JOIN order_items oi ON oi.order_id = o.id
+        LEFT JOIN products p ON p.id = oi.product_id
+        {where}
+        ORDER BY o.created_at, o.id, oi.id
+    '''
+
+
+def iter_chunks(conn, fields, since=None, until=None, chunk_rows=5000):
+    """Yield lists of row tuples, all read from one snapshot of the database"""
+    conditions, params = date_range(since, until)
+    conn.row_factory = None
+
+    conn.execute('BEGIN')
+    try:
+        cursor = conn.execute(export_query(fields, conditions), params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.rollback()
+
+
+def iter_csv(chunks, fields):
+    """Encode row chunks as CSV, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(fields)
+
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_column(values, column_type):
+    """One column of a chunk; strings are dictionary-encoded"""
+    if column_type != 'string':
+        return list(values)
+
+    dictionary = {}
+    indices = [dictionary.setdefault(value, len(dictionary)) for value in values]
+    return {'dictionary': list(dictionary), 'indices': indices}
+
+
+def iter_columnar(chunks, fields, since=None, until=None):
+    """Encode row chunks in the columnar format, schema line first"""
+    schema = {
+        'format': 'columnar',
+        'version': COLUMNAR_VERSION,
+        'columns': [{'name': name, 'type': EXPORT_COLUMNS[name][1]} for name in fields],
+        'from': since,
+        'to': until
+    }
+    yield (json.dumps(schema) + '\n').encode('utf-8')
+
+    for rows in chunks:
+        columns = zip(*rows)
+        chunk = {
+            'rows': len(rows),
+            'columns': {
+                name: encode_column(values, EXPORT_COLUMNS[name][1])
+                for name, values in zip(fields, columns)
+            }
+        }
+        yield (json.dumps(chunk, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def iter_export(conn, fmt, fields, since=None, until=None, chunk_rows=5000):
+    """Yield the encoded export; the caller owns (and closes) conn"""
+    chunks = iter_chunks(conn, fields, since, until, chunk_rows)
+    if fmt == 'csv':
+        return iter_csv(chunks, fields)
+    return iter_columnar(chunks, fields, since, until)
+
+
+def read_columnar(lines):
+    """Decode a columnar export back into row dicts"""
+    lines = iter(lines)
+    schema = json.loads(next(lines))
+    if schema.get('format') != 'columnar' or schema.get('version') != COLUMNAR_VERSION:
+        raise ValueError('Not a version 1 columnar export')
+    names = [column['name'] for column in schema['columns']]
+
+    for line in lines:
+        if not line.strip():
+            continue
+        chunk = json.loads(line)
+        columns = []
+        for name in names:
+            column = chunk['columns'][name]
+            if isinstance(column, dict):
+                column = [column['dictionary'][index] for index in column['indices']]
+            columns.append(column)
+        for values in zip(*columns):
+            yield dict(zip(names, values))
@@ -0,0 +1,100 @@
+"""
+Collision-free order number generator
+Order numbers look like ORD-20240115103000-007-00042:
+UTC timestamp (seconds) - worker id - per-second sequence. The stamp is
+UTC so it never repeats when daylight saving time ends.
+They sort by creation time, are strictly increasing within a process, and
+two processes never produce the same number as long as their worker ids
+differ. Run this file to benchmark it.
+"""
+import os
+import threading
+import time
+
+MAX_WORKER_ID = 999
+MAX_SEQUENCE = 99999
+
+
+class OrderNumberGenerator:
+    """Thread-safe, monotonic ORD-<time>-<worker>-<seq> generator"""
+
+    def __init__(self, worker_id=None, prefix='ORD'):
+        self.prefix = prefix
+        self._configured_worker_id = worker_id
+        self._reset()
+
+        # A forked worker must not reuse the parent's worker id or sequence
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """(Re)derive the worker id and restart the sequence for this process"""
+        if self._configured_worker_id is not None:
+            worker_id = int(self._configured_worker_id)
+        else:
+            worker_id = os.getpid() % (MAX_WORKER_ID + 1)
+
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'worker_id must be between 0 and {MAX_WORKER_ID}')
+
+        self.worker_id = worker_id
+        self._second = 0
+        self._sequence = -1
+        self._stamp = ''
+        # Fresh lock too: the parent may have held it at fork time
+        self._lock = threading.Lock()
+
+    def set_worker_id(self, worker_id):
+        """Use a specific worker id from now on (e.g. one slot per server worker)"""
+        self._configured_worker_id = worker_id
+        self._reset()
+
+    def next(self):
+        """Generate the next order number"""
+        with self._lock:
+            now = int(time.time())
+
+            if now > self._second:
+                self._second = now
+                self._sequence = 0
+                self._stamp = time.strftime('%Y%m%d%H%M%S', time.gmtime(now))
+            elif self._sequence < MAX_SEQUENCE:
+                # Same second, or the clock stepped back: keep counting
+                self._sequence += 1
+            else:
+                # Sequence exhausted - borrow the next second to stay unique and ordered
+                self._second += 1
+                self._sequence = 0
+                self._stamp = time.strftime('%Y%m%d%H%M%S', time.gmtime(self._second))
+
+            return f'{self.prefix}-{self._stamp}-{self.worker_id:03d}-{self._sequence:05d}'
+
+
+if __name__ == '__main__':
+    # Benchmark: generate numbers from several threads, check uniqueness and order
+    THREADS = 8
+    PER_THREAD = 50000
+
+    generator = OrderNumberGenerator()
+    results = [[] for _ in range(THREADS)]
+
+    def work(out):
+        for _ in range(PER_THREAD):
+            out.append(generator.next())
+
+    threads = [threading.Thread(target=work, args=(out,)) for out in results]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    numbers = [number for out in results for number in out]
+    total = THREADS * PER_THREAD
+
+    print(f"Generated {total} order numbers with {THREADS} threads in {elapsed:.3f}s")
+    print(f"Throughput: {total / elapsed:,.0f} numbers/sec")
+    print(f"Unique: {len(set(numbers)) == total}")
+    print(f"Increasing within each thread: {all(out == sorted(out) for out in results)}")
+    print(f"Example: {numbers[0]}")
@@ -0,0 +1,119 @@
+"""
+Set-based order item pipeline for create_order
+A cart of any size costs a fixed number of statements: one product lookup,
+one executemany for the items and one guarded stock UPDATE, all inside the
+caller's write transaction.
+"""
+
+# Products of a cart, by name (placeholders filled per cart)
+PRODUCTS_BY_NAME_QUERY = '''
+    SELECT id, name, category, stock FROM products
+    WHERE name IN ({placeholders})
+    ORDER BY id
+'''
+
+
+class InsufficientStockError(Exception):
+    """Raised when a cart asks for more units than a product has in stock"""
+
+    def __init__(self, shortages):
+        super().__init__('Insufficient stock')
+        self.shortages = shortages
+
+
+def parse_quantity(value):
+    """Validate a cart quantity (positive whole number)"""
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid quantity: {value!r}')
+
+    if quantity <= 0 or quantity != float(value):
+        raise ValueError(f'Invalid quantity: {value!r}')
+    return quantity
+
+
+def resolve_lines(cursor, items):
+    """Resolve cart items to order lines with one product query
+
+    Items naming an unknown product are skipped, as before. Returns the
+    lines and a map of product id -> current stock.
+    """
+    names = list(dict.fromkeys(item['product'] for item in items))
+    if not names:
+        return [], {}
+
+    cursor.execute(PRODUCTS_BY_NAME_QUERY.format(placeholders=', '.join('?' * len(names))), names)
+
+    # Duplicate names resolve to the oldest product, like the old per-item lookup
+    products = {}
+    for row in cursor.fetchall():
+        products.setdefault(row['name'], row)
+
+    lines = []
+    for item in items:
+        product = products.get(item['product'])
+        if product is None:
+            continue
+        lines.append({
+            'product_id': product['id'],
+            'name': product['name'],
+            'category': product['category'],
+            'quantity': parse_quantity(item['quantity']),
+            'price': None   # catalog price, set by pricing.quote()
+        })
+
+    stock = {row['id']: row['stock'] for row in products.values()}
+    return lines, stock
+
+
+def requested_quantities(lines):
+    """Total quantity per product id (a product may appear on several lines)"""
+    totals = {}
+    for line in lines:
+        totals[line['product_id']] = totals.get(line['product_id'], 0) + line['quantity']
+    return totals
+
+
+def check_stock(lines, stock):
+    """Reject the whole cart if any product would be oversold"""
+    names = {line['product_id']: line['name'] for line in lines}
+    shortages = [
+        {'product': names[product_id], 'requested': quantity, 'available': stock[product_id] or 0}
+        for product_id, quantity in requested_quantities(lines).items()
+        if quantity > (stock[product_id] or 0)
+    ]
+    if shortages:
+        raise InsufficientStockError(shortages)
+
+
+def add_order_items(cursor, order_id, lines):
+    """Insert all order lines with a single executemany"""
+    cursor.executemany('''
+        INSERT INTO order_items (order_id, product_id, quantity, price)
+        VALUES (?, ?, ?, ?)
+    ''', [(order_id, line['product_id'], line['quantity'], line['price']) for line in lines])
+
+
+def decrement_stock(cursor, lines):
+    """Take the ordered units out of stock with one guarded UPDATE
+
+    Each product row is only updated if it still has enough stock, so a
+    short rowcount means an oversell and the caller must roll back.
+    """
+    totals = requested_quantities(lines)
+    if not totals:
+        return
+
+    case = ' '.join('WHEN ? THEN ?' for _ in totals)
+    case_params = [value for pair in totals.items() for value in pair]
+    placeholders = ', '.join('?' * len(totals))
+
+    cursor.execute(f'''
+        UPDATE products
+        SET stock = stock - (CASE id {case} END)
+        WHERE id IN ({placeholders}) AND stock >= (CASE id {case} END)
+    ''', case_params + list(totals) + case_params)
+
+    if cursor.rowcount != len(totals):
+        raise InsufficientStockError([])
@@ -0,0 +1,138 @@
+"""
+Keyset (cursor) pagination and field projection for list endpoints
+Pages are addressed by an opaque cursor over (created_at, id) of the last
+row returned, so fetching page N costs the same as fetching page 1.
+"""
+import base64
+import json
+from functools import lru_cache
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# Columns every page query selects so the next cursor can be built
+CURSOR_FIELDS = ('created_at', 'id')
+
+
+def encode_cursor(row):
+    """Build the opaque cursor pointing just past this row"""
+    raw = json.dumps([row['created_at'], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor back into its (created_at, id) pair"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid pagination cursor')
+
+
+def parse_page(args):
+    """Read limit/after from the request args; (None, None) means no paging"""
+    limit = args.get('limit')
+    after = args.get('after')
+
+    if limit is None and after is None:
+        return None, None
+
+    try:
+        limit = int(limit) if limit is not None else DEFAULT_LIMIT
+    except ValueError:
+        raise ValueError('limit must be an integer')
+
+    limit = max(1, min(limit, MAX_LIMIT))
+    return limit, decode_cursor(after) if after else None
+
+
+def parse_fields(value, columns):
+    """Parse a comma separated fields= list, validated against the known columns"""
+    if not value:
+        return list(columns)
+
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    return fields
+
+
+def parse_expand(value, allowed):
+    """Parse a comma separated expand= list, validated against what the route can embed"""
+    expand = {e.strip() for e in (value or '').split(',') if e.strip()}
+    unknown = sorted(expand - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown expand: {', '.join(unknown)}")
+
+    return expand
+
+
+@lru_cache(maxsize=256)
+def _page_columns(fields):
+    return fields + tuple(f for f in CURSOR_FIELDS if f not in fields)
+
+
+def page_columns(fields):
+    """Column names of a page query, in select order: the fields, then the cursor columns"""
+    return _page_columns(tuple(fields))
+
+
+def select_list(fields, columns):
+    """SQL select list for the requested fields plus the cursor columns"""
+    return ', '.join(f'{columns[name]} as {name}' for name in page_columns(fields))
+
+
+def keyset_condition(after, created_at_column, id_column, descending=False):
+    """WHERE condition (and params) selecting the rows after the cursor"""
+    if after is None:
+        return None, ()
+
+    op = '<' if descending else '>'
+    return f'({created_at_column}, {id_column}) {op} (?, ?)', after
+
+
+def order_clause(created_at_column, id_column, descending=False):
+    """ORDER BY matching the keyset condition"""
+    direction = 'DESC' if descending else 'ASC'
+    return f'ORDER BY {created_at_column} {direction}, {id_column} {direction}'
+
+
+def where_clause(conditions):
+    """Join the non-empty conditions into a WHERE clause"""
+    conditions = [c for c in conditions if c]
+    return 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+
+def fetch_tuples(cursor):
+    """fetchall() as plain tuples, skipping the per-row sqlite3.Row objects"""
+    row_factory, cursor.row_factory = cursor.row_factory, None
+    try:
+        return cursor.fetchall()
+    finally:
+        cursor.row_factory = row_factory
+
+
+def page_rows(rows, fields, limit):
+    """Trim page query tuples to the page and work out the next cursor
+
+    The page query fetches limit + 1 rows; the extra row only signals that
+    another page exists and is not returned.
+    """
+    if limit is None or len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(dict(zip(page_columns(fields), rows[-1])))
+
+
+def build_page(rows, fields, limit):
+    """Project page query tuples to field dicts and work out the next cursor
+
+    Rows are in select_list() order, so the requested fields are the leading
+    columns and each dict is just zip(fields, row).
+    """
+    rows, next_cursor = page_rows(rows, fields, limit)
+    return [dict(zip(fields, row)) for row in rows], next_cursor
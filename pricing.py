@@ -0,0 +1,107 @@
+"""
+Server-side order pricing
+Order totals come from catalog prices, never from the client. Prices are
+kept in a PriceMap keyed by product id and tied to the product_prices
+counter in table_versions, which a trigger bumps whenever a product's price
+changes (see migrations.py). An order reads that version in its own
+transaction (one primary key lookup), so a price changed by any process is
+applied at once; the prices themselves cost one batched query only for
+products the map hasn't seen yet at that version.
+
+Amounts are Decimal throughout: line totals are summed exactly, and the
+subtotal and discount are rounded half-up to the cent once each.
+"""
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+
+PRICES_QUERY = 'SELECT id, price FROM products WHERE id IN ({placeholders})'
+
+
+def to_decimal(value):
+    """Decimal from a SQLite REAL or JSON number, via its shortest repr"""
+    return Decimal(str(value))
+
+
+def money(value):
+    """Round to the cent, half-up"""
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class PriceMap:
+    """Product id -> Decimal price, valid for one price version"""
+
+    def __init__(self):
+        self._version = None
+        self._prices = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, cursor, product_ids, version):
+        """Prices of the given products (id -> Decimal) at a product_prices version
+
+        Run it inside the order's transaction, so prices loaded for it are
+        the ones committed alongside it.
+        """
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self.invalidations += 1
+                self._version, self._prices = version, {}
+            prices = self._prices
+            missing = [product_id for product_id in set(product_ids) if product_id not in prices]
+            self.hits += len(product_ids) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            cursor.execute(PRICES_QUERY.format(placeholders=', '.join('?' * len(missing))), missing)
+            loaded = {row[0]: to_decimal(row[1]) for row in cursor.fetchall()}
+            prices = {**prices, **loaded}
+            # Copy on write: readers keep using the snapshot they took
+            with self._lock:
+                if self._version == version:
+                    self._prices = {**self._prices, **loaded}
+
+        unknown = [product_id for product_id in product_ids if product_id not in prices]
+        if unknown:
+            raise ValueError(f'Products no longer available: {unknown}')
+        return {product_id: prices[product_id] for product_id in product_ids}
+
+    def clear(self):
+        with self._lock:
+            self._version, self._prices = None, {}
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return {
+                'entries': len(self._prices),
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
+
+
+def quote(lines, prices, rule=None):
+    """Price order lines in one pass; returns (subtotal, discount, total) as Decimals
+
+    Each line's 'price' is set to the catalog unit price. rule, a
+    discounts.DiscountRule, works out the discount from the subtotal and
+    the subtotal per category.
+    """
+    subtotal = Decimal(0)
+    by_category = {}
+    for line in lines:
+        unit = prices[line['product_id']]
+        amount = unit * line['quantity']
+        line['price'] = float(unit)
+        subtotal += amount
+        by_category[line['category']] = by_category.get(line['category'], 0) + amount
+
+    subtotal = money(subtotal)
+    discount = rule.discount(subtotal, by_category) if rule is not None else Decimal(0)
+    return subtotal, discount, subtotal - discount
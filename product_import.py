@@ -0,0 +1,250 @@
+"""
+Bulk product upsert from CSV or NDJSON
+Input is read as a stream and validated row by row; valid rows are applied
+in chunks, each chunk being one job for the single writer (one transaction,
+an executemany for the inserts and one for the updates). The next chunk is
+parsed while the previous one is being written. Invalid rows are skipped
+and reported with their row number. A chunk that a constraint rejects is
+retried row by row, so only the offending rows fail.
+
+A row with an id updates that product. A row without an id is matched by
+name (the oldest product with that name, as checkout does) and updated,
+or inserted if there is none. Updates only change the columns the row
+provides, so a price refresh can be just "name,price".
+"""
+import csv
+import io
+import json
+import math
+import sqlite3
+from functools import partial
+
+# Column -> converter; unknown columns are ignored
+COLUMNS = {
+    'name': str,
+    'category': str,
+    'description': str,
+    'price': float,
+    'size': str,
+    'stock': int,
+    'rating': float,
+    'image_url': str
+}
+
+# Values for columns a new product doesn't provide, as in POST /api/products
+INSERT_DEFAULTS = {'description': '', 'size': '', 'stock': 0, 'rating': 0.0, 'image_url': None}
+REQUIRED_FOR_INSERT = ('name', 'category', 'price')
+
+# Keep the report readable for very bad files
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(content_type, requested=None):
+    """Pick the input format from ?format= or the Content-Type"""
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f'format must be one of: {", ".join(FORMATS)}')
+        return requested
+
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return 'ndjson'
+    raise ValueError('Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson')
+
+
+def read_records(binary_stream, fmt):
+    """Yield (row number, record dict or None, parse error or None) from a byte stream"""
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            # Row numbers count the header line, so they match a spreadsheet
+            yield reader.line_num, record, None
+        return
+
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield number, None, 'Each line must be a JSON object'
+            continue
+        yield number, record, None
+
+
+def clean_row(record):
+    """Validate one record; returns (product id or None, {column: value})"""
+    values = {}
+    for column, convert in COLUMNS.items():
+        value = record.get(column)
+        if value is None or value == '':
+            continue
+        try:
+            value = convert(value.strip() if isinstance(value, str) else value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid {column}: {value!r}')
+        if convert is int and isinstance(record[column], float) and record[column] != value:
+            raise ValueError(f'Invalid {column}: {record[column]!r}')
+        # float() accepts 'nan' and 'inf'
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError(f'Invalid {column}: {record[column]!r}')
+        values[column] = value
+
+    if values.get('price', 0) < 0:
+        raise ValueError('price must not be negative')
+    if values.get('stock', 0) < 0:
+        raise ValueError('stock must not be negative')
+    if not 0 <= values.get('rating', 0) <= 5:
+        raise ValueError('rating must be between 0 and 5')
+
+    product_id = record.get('id')
+    if product_id in (None, ''):
+        product_id = None
+        if 'name' not in values:
+            raise ValueError('Row needs an id or a name')
+    else:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid id: {product_id!r}')
+
+    return product_id, values
+
+
+def apply_chunk(cursor, rows):
+    """Upsert one chunk of (row number, id, values); returns (inserted, updated, errors)"""
+    errors = []
+
+    # Resolve ids and names, up to 500 per query
+    ids = list({product_id for _, product_id, _ in rows if product_id is not None})
+    existing_ids = set()
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        cursor.execute(f'SELECT id FROM products WHERE id IN ({", ".join("?" * len(batch))})', batch)
+        existing_ids.update(row[0] for row in cursor.fetchall())
+
+    names = list({values['name'] for _, product_id, values in rows if product_id is None})
+    ids_by_name = {}
+    for start in range(0, len(names), 500):
+        batch = names[start:start + 500]
+        cursor.execute(f'SELECT id, name FROM products WHERE name IN ({", ".join("?" * len(batch))})', batch)
+        # The oldest product with a name wins (no ORDER BY: it would trade the
+        # name index for a walk over the whole table in id order)
+        for product_id, name in cursor.fetchall():
+            if product_id < ids_by_name.get(name, product_id + 1):
+                ids_by_name[name] = product_id
+
+    # Later rows for the same product override earlier ones, as if applied in order
+    updates = {}
+    inserts = {}
+    for number, product_id, values in rows:
+        if product_id is None:
+            product_id = ids_by_name.get(values['name'])
+            if product_id is None:
+                inserts.setdefault(values['name'], [number, {}])[1].update(values)
+                continue
+            # Matched by name, so the name itself doesn't change
+            values = {column: value for column, value in values.items() if column != 'name'}
+        elif product_id not in existing_ids:
+            errors.append({'row': number, 'error': f'No product with id {product_id}'})
+            continue
+        updates.setdefault(product_id, {}).update(values)
+
+    insert_rows = []
+    for name, (number, values) in inserts.items():
+        missing = [column for column in REQUIRED_FOR_INSERT if column not in values]
+        if missing:
+            errors.append({'row': number, 'error': f'New product needs: {", ".join(missing)}'})
+            continue
+        values = dict(INSERT_DEFAULTS, **values)
+        insert_rows.append(tuple(values[column] for column in COLUMNS))
+
+    if insert_rows:
+        cursor.executemany(f'''
+            INSERT INTO products ({", ".join(COLUMNS)})
+            VALUES ({", ".join("?" * len(COLUMNS))})
+        ''', insert_rows)
+
+    # One executemany per set of updated columns (usually just one), so
+    # e.g. a price refresh doesn't rewrite names or re-index the search table
+    by_columns = {}
+    for product_id, values in updates.items():
+        columns = tuple(column for column in COLUMNS if column in values)
+        by_columns.setdefault(columns, []).append(
+            tuple(values[column] for column in columns) + (product_id,)
+        )
+    for columns, params in by_columns.items():
+        if columns:
+            assignments = ', '.join(f'{column} = ?' for column in columns)
+            cursor.executemany(f'UPDATE products SET {assignments} WHERE id = ?', params)
+
+    return len(insert_rows), len(updates), errors
+
+
+def import_products(records, writer, chunk_rows=5000):
+    """Validate and apply (row number, record, parse error) triples; returns the report"""
+    report = {'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    pending = None
+
+    def add_errors(errors):
+        report['failed'] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(report['errors'])
+        report['errors'].extend(errors[:max(room, 0)])
+
+    def collect(future, rows):
+        try:
+            inserted, updated, errors = future.result()
+        except sqlite3.IntegrityError:
+            # The chunk was rolled back; apply its rows one by one to find the bad ones
+            inserted = updated = 0
+            errors = []
+            futures = [(row, writer.submit(partial(apply_chunk, rows=[row]))) for row in rows]
+            for row, row_future in futures:
+                try:
+                    row_inserted, row_updated, row_errors = row_future.result()
+                except sqlite3.IntegrityError as e:
+                    errors.append({'row': row[0], 'error': str(e)})
+                    continue
+                inserted += row_inserted
+                updated += row_updated
+                errors.extend(row_errors)
+        report['inserted'] += inserted
+        report['updated'] += updated
+        add_errors(errors)
+
+    chunk = []
+    for number, record, error in records:
+        report['rows'] += 1
+        if error is None:
+            try:
+                product_id, values = clean_row(record)
+                chunk.append((number, product_id, values))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            add_errors([{'row': number, 'error': error}])
+
+        if len(chunk) >= chunk_rows:
+            # Write this chunk while the next one is parsed
+            if pending is not None:
+                collect(*pending)
+            pending = writer.submit(partial(apply_chunk, rows=chunk)), chunk
+            chunk = []
+
+    if pending is not None:
+        collect(*pending)
+    if chunk:
+        collect(writer.submit(partial(apply_chunk, rows=chunk)), chunk)
+
+    report['errors'].sort(key=lambda error: error['row'])
+    report['errors_truncated'] = report['failed'] > len(report['errors'])
+    return report
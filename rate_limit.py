@@ -0,0 +1,183 @@
+"""
+Rate limiting and load shedding for AgriChem Solutions API
+Two cheap checks run before a limited route does any work:
+
+- Token buckets per client and route (RATE_LIMITS: route -> (requests per
+  second, burst)). An empty bucket answers 429 with Retry-After. Buckets
+  live in a store: MemoryStore keeps them in the process (each gunicorn
+  worker counts on its own), RedisStore shares them between processes and
+  hosts. RedisStore works with any redis-py compatible client, so tests
+  can hand it a local stand-in such as fakeredis. If the store fails, the
+  request is let through and the failure counted.
+- Concurrency limits (CONCURRENCY_LIMITS: route -> requests in flight per
+  process, MAX_PENDING_WRITES for the single writer's queue). Over the
+  limit the request is refused at once with 503, instead of queueing until
+  it times out.
+"""
+import math
+import threading
+import time
+
+# Seconds a shed request is told to wait before retrying
+SHED_RETRY_AFTER = 1
+
+
+class MemoryStore:
+    """Token buckets in this process"""
+
+    # Full buckets are forgotten every PRUNE_EVERY calls to bound memory
+    PRUNE_EVERY = 4096
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._buckets = {}   # key -> [tokens, updated, seconds to refill completely]
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def take(self, key, rate, burst):
+        """Take a token; returns (allowed, tokens left, seconds until the next token)"""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now, burst / rate]
+
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            bucket[0], bucket[1] = tokens, now
+
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                self._prune(now)
+
+        return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now):
+        stale = [key for key, (_, updated, refill) in self._buckets.items() if now - updated >= refill]
+        for key in stale:
+            del self._buckets[key]
+
+
+# Refill and take in one atomic step, on the Redis server's clock.
+# Numbers go back as strings (Redis would truncate Lua floats to integers).
+TOKEN_BUCKET_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+'''
+
+
+class RedisStore:
+    """Token buckets shared through Redis (any redis-py compatible client)"""
+
+    def __init__(self, client, prefix='agrichem:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, key, rate, burst):
+        """Take a token; returns (allowed, tokens left, seconds until the next token)"""
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[rate, burst])
+        allowed, tokens = bool(int(allowed)), float(tokens)
+        return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+
+def store_from_url(url):
+    """MemoryStore for None/'memory://', RedisStore for a redis:// URL"""
+    if not url or url == 'memory://':
+        return MemoryStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATE_LIMIT_STORAGE_URL is a Redis URL but the redis package is not installed')
+        return RedisStore(redis.Redis.from_url(url))
+    raise ValueError(f'Unsupported RATE_LIMIT_STORAGE_URL: {url}')
+
+
+class RateLimiter:
+    """Per client, per route token buckets"""
+
+    def __init__(self, store, limits):
+        self.store = store
+        self.limits = limits   # endpoint -> (rate, burst)
+        self._lock = threading.Lock()
+        self.store_errors = 0
+
+    def check(self, client, endpoint):
+        """(allowed, limit headers) for a request, or None if the route isn't limited"""
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return None
+        rate, burst = limit
+
+        allowed, tokens, retry_after = self.store.take(f'{endpoint}:{client}', rate, burst)
+        headers = {
+            'X-RateLimit-Limit': str(burst),
+            'X-RateLimit-Remaining': str(int(tokens))
+        }
+        if not allowed:
+            headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return allowed, headers
+
+    def count_store_error(self):
+        """Count a check the store failed to answer (the request was let through)"""
+        with self._lock:
+            self.store_errors += 1
+
+    def stats(self):
+        with self._lock:
+            return {'store_errors': self.store_errors}
+
+
+class ConcurrencyLimiter:
+    """Caps on requests in flight per route in this process"""
+
+    def __init__(self, limits):
+        self.limits = limits   # endpoint -> max requests in flight
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.shed = 0
+
+    def acquire(self, endpoint):
+        """Take a slot for the request; False (and counted as shed) if the route is full"""
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return True
+        with self._lock:
+            in_flight = self._in_flight.get(endpoint, 0)
+            if in_flight >= limit:
+                self.shed += 1
+                return False
+            self._in_flight[endpoint] = in_flight + 1
+            return True
+
+    def count_shed(self):
+        """Count a request refused for another reason (e.g. a full write queue)"""
+        with self._lock:
+            self.shed += 1
+
+    def release(self, endpoint):
+        if endpoint not in self.limits:
+            return
+        with self._lock:
+            self._in_flight[endpoint] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': dict(self._in_flight), 'shed': self.shed}
@@ -15,14 +15,11 @@ else:
     print("\n✓ Database already exists")
 
 print("✓ Importing Flask app...")
-from app import app, init_db, seed_data
+from app import app, prepare_database
 
-# Initialize database if needed
-if not os.path.exists('agrichem.db'):
-    print("✓ Initializing database tables...")
-    init_db()
-    print("✓ Seeding initial data...")
-    seed_data()
+# Initialize database if needed (creates, migrates and seeds)
+print("✓ Preparing database...")
+prepare_database()
 
 print("\n" + "="*60)
 print("Server Configuration:")
@@ -35,4 +32,5 @@ print("\nServer is running... Press Ctrl+C to stop\n")
 
 # Run the app
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
+    # Development server - use serve.py for production
+    app.run(debug=app.config['DEBUG'], host='0.0.0.0', port=5000, use_reloader=False)
@@ -0,0 +1,102 @@
+"""
+Catalog search for AgriChem Solutions API
+Uses the catalog_fts FTS5 index (see migrations.py) for BM25-ranked prefix
+search with highlighted snippets, and falls back to LIKE matching when the
+index is missing (SQLite built without FTS5).
+"""
+import re
+import sqlite3
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# Relevance weights for bm25(): name matches count more than description matches
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+FTS_CATALOG_QUERY = f'''
+    SELECT f.kind as type, f.ref_id as id, f.name, f.description,
+           COALESCE(p.price, s.price) as price,
+           highlight(catalog_fts, 0, '<mark>', '</mark>') as name_highlight,
+           snippet(catalog_fts, 1, '<mark>', '</mark>', '…', 12) as snippet
+    FROM catalog_fts f
+    LEFT JOIN products p ON f.kind = 'product' AND p.id = f.ref_id
+    LEFT JOIN services s ON f.kind = 'service' AND s.id = f.ref_id
+    WHERE catalog_fts MATCH ?
+    ORDER BY bm25(catalog_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT})
+    LIMIT ? OFFSET ?
+'''
+
+LIKE_CATALOG_QUERY = '''
+    SELECT 'product' as type, id, name, description, price,
+           name as name_highlight, description as snippet
+    FROM products
+    WHERE name LIKE :pattern OR description LIKE :pattern
+    UNION ALL
+    SELECT 'service' as type, id, name, description, price,
+           name as name_highlight, description as snippet
+    FROM services
+    WHERE name LIKE :pattern OR description LIKE :pattern
+    LIMIT :limit OFFSET :offset
+'''
+
+FTS_PRODUCTS_QUERY = f'''
+    SELECT p.*
+    FROM catalog_fts f
+    JOIN products p ON p.id = f.ref_id
+    WHERE catalog_fts MATCH ? AND f.kind = 'product'
+    ORDER BY bm25(catalog_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT})
+    LIMIT ? OFFSET ?
+'''
+
+LIKE_PRODUCTS_QUERY = '''
+    SELECT * FROM products
+    WHERE name LIKE :pattern OR description LIKE :pattern
+    LIMIT :limit OFFSET :offset
+'''
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def parse_paging(args):
+    """Read limit/offset from the request args, clamped to sane values"""
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise ValueError('limit and offset must be integers')
+
+    return max(1, min(limit, MAX_LIMIT)), max(0, offset)
+
+
+def _run(cursor, fts_sql, like_sql, text, limit, offset):
+    """Run the FTS query, or the LIKE query if FTS can't serve this search"""
+    match = build_match_query(text)
+
+    if match:
+        try:
+            cursor.execute(fts_sql, (match, limit, offset))
+            return cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            # Index missing (no FTS5 in this SQLite build) - use LIKE instead
+            if 'catalog_fts' not in str(e) and 'fts5' not in str(e):
+                raise
+
+    cursor.execute(like_sql, {'pattern': f'%{text}%', 'limit': limit, 'offset': offset})
+    return cursor.fetchall()
+
+
+def search_catalog(cursor, text, limit=DEFAULT_LIMIT, offset=0):
+    """Search products and services in one ranked query"""
+    return _run(cursor, FTS_CATALOG_QUERY, LIKE_CATALOG_QUERY, text, limit, offset)
+
+
+def search_products(cursor, text, limit=DEFAULT_LIMIT, offset=0):
+    """Search products only, returning full product rows ranked by relevance"""
+    return _run(cursor, FTS_PRODUCTS_QUERY, LIKE_PRODUCTS_QUERY, text, limit, offset)
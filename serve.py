@@ -0,0 +1,97 @@
+"""
+Production server for AgriChem Solutions API
+Runs the Flask app under gunicorn (several worker processes, each with a
+thread pool) on Linux/macOS, or under waitress (threads only) on Windows.
+All settings come from ProductionConfig in config.py.
+
+Usage: python serve.py
+"""
+import os
+import sys
+
+os.environ.setdefault('FLASK_CONFIG', 'production')
+
+from app import app, prepare_database
+import database
+
+
+def print_banner(server, workers, threads):
+    """Print the startup summary"""
+    print("=" * 60)
+    print("AgriChem Solutions API - Production Server")
+    print("=" * 60)
+    print(f"Server: {server}")
+    print(f"URL: http://{app.config['SERVER_HOST']}:{app.config['SERVER_PORT']}")
+    print(f"Workers: {workers}, threads per worker: {threads}")
+    print("=" * 60 + "\n")
+
+
+def run_gunicorn():
+    """Serve with gunicorn using threaded (gthread) workers"""
+    from gunicorn.app.base import BaseApplication
+
+    base_worker_id = int(app.config['ORDER_WORKER_ID'] or 0)
+
+    def pre_fork(server, worker):
+        # Runs in the master: give each live worker a distinct slot number
+        used = {getattr(w, 'slot', None) for w in server.WORKERS.values()}
+        worker.slot = next(i for i in range(len(used) + 1) if i not in used)
+
+    def post_fork(server, worker):
+        # Never share pooled connections or the writer across processes, and
+        # give every worker its own order-number worker id
+        database.close_pool(app)
+        app.extensions.pop('db_writer', None)
+        from app import order_numbers
+        order_numbers.set_worker_id((base_worker_id + worker.slot) % 1000)
+
+    class AgriChemApplication(BaseApplication):
+        def load_config(self):
+            settings = {
+                'bind': f"{app.config['SERVER_HOST']}:{app.config['SERVER_PORT']}",
+                'workers': app.config['SERVER_WORKERS'],
+                'threads': app.config['SERVER_THREADS'],
+                'worker_class': 'gthread',
+                'keepalive': app.config['SERVER_KEEPALIVE'],
+                'timeout': app.config['SERVER_TIMEOUT'],
+                'graceful_timeout': app.config['SERVER_GRACEFUL_TIMEOUT'],
+                'backlog': app.config['SERVER_BACKLOG'],
+                'preload_app': True,
+                'pre_fork': pre_fork,
+                'post_fork': post_fork,
+                'accesslog': '-'
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    print_banner('gunicorn', app.config['SERVER_WORKERS'], app.config['SERVER_THREADS'])
+    AgriChemApplication().run()
+
+
+def run_waitress():
+    """Serve with waitress (Windows: a single process with a thread pool)"""
+    from waitress import serve
+
+    threads = app.config['SERVER_WORKERS'] * app.config['SERVER_THREADS']
+    print_banner('waitress', 1, threads)
+    serve(
+        app,
+        host=app.config['SERVER_HOST'],
+        port=app.config['SERVER_PORT'],
+        threads=threads,
+        channel_timeout=app.config['SERVER_TIMEOUT'],
+        backlog=app.config['SERVER_BACKLOG']
+    )
+
+
+if __name__ == '__main__':
+    # Create/migrate/seed once, in this process, before any worker starts
+    prepare_database()
+
+    if sys.platform == 'win32':
+        run_waitress()
+    else:
+        run_gunicorn()
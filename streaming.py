@@ -0,0 +1,59 @@
+"""
+Streaming (NDJSON) responses for bulk list endpoints
+Rows are pulled from the cursor with fetchmany() and written out chunk by
+chunk, so memory use stays flat no matter how large the table is.
+"""
+from flask import Response, current_app, request, stream_with_context
+
+import pagination
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_stream():
+    """Check whether the client asked for a streamed NDJSON response"""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def iter_ndjson(cursor, fields, encode, chunk_size=500, page=None):
+    """Yield encoded NDJSON chunks, one object per row
+
+    The cursor returns plain tuples in select_list() order (fields first),
+    and encode turns an object into JSON bytes. Rows already fetched (page)
+    are written first, then the rest of the cursor.
+    """
+    if page is not None:
+        for start in range(0, len(page), chunk_size):
+            yield b''.join(encode(dict(zip(fields, row))) + b'\n' for row in page[start:start + chunk_size])
+        return
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+
+        yield b''.join(encode(dict(zip(fields, row))) + b'\n' for row in rows)
+
+
+def ndjson_response(cursor, fields, limit=None):
+    """Stream the rest of an executed cursor as an NDJSON response
+
+    A paged query (limit set) returns at most MAX_LIMIT + 1 rows, so its page
+    is read up front and the next page's cursor sent in X-Next-Cursor.
+    """
+    chunk_size = current_app.config['STREAM_CHUNK_ROWS']
+    cursor.row_factory = None
+    page = None
+    headers = {}
+    if limit is not None:
+        page, next_cursor = pagination.page_rows(cursor.fetchmany(limit + 1), fields, limit)
+        if next_cursor is not None:
+            headers['X-Next-Cursor'] = next_cursor
+    return Response(
+        stream_with_context(iter_ndjson(cursor, fields, current_app.json.encode, chunk_size, page)),
+        mimetype=NDJSON_MIMETYPE,
+        headers=headers
+    )
@@ -0,0 +1,179 @@
+"""
+Synthetic data for benchmarks and load tests
+Fills a database with the current schema with a reproducible (seeded)
+catalog, customer base and order history, e.g. 100k products and 1M orders.
+Rows are generated lazily and inserted with executemany in chunks, so
+memory stays flat however many rows are requested.
+
+Usage: python synthetic_data.py <database> [--products N] [--customers N] [--orders N]
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+from app import app, init_db, seed_data, connect_db
+import dashboard
+
+CHUNK_ROWS = 10000
+
+CATEGORIES = ('insecticide', 'herbicide', 'fungicide', 'fertilizer', 'growth-regulator')
+ACTIVE_INGREDIENTS = (
+    'Chlorpyrifos', 'Deltamethrin', 'Cypermethrin', 'Imidacloprid', 'Glyphosate', 'Atrazine',
+    'Mancozeb', 'Carbendazim', 'Azoxystrobin', 'Urea', 'Potash', 'Gibberellin', 'Neem', 'Sulphur'
+)
+FORMULATIONS = ('EC', 'SC', 'WP', 'WG', 'SL', 'Granules', 'Dust')
+SIZES = ('250ml Bottle', '500ml Bottle', '1L Bottle', '5L Container', '1kg Pack', '25kg Bag')
+CROPS = ('rice', 'wheat', 'cotton', 'maize', 'sugarcane', 'vegetables', 'fruits')
+STATUSES = ('pending', 'confirmed', 'shipped', 'delivered', 'cancelled')
+
+# Timestamps are spread over this many days before now
+HISTORY_DAYS = 730
+
+# Benchmark product stock: large enough that checkouts never run out
+BENCHMARK_STOCK = 1000000
+
+
+def timestamp(rng, start):
+    """Random CURRENT_TIMESTAMP-formatted time within the history window"""
+    return (start + timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def product_name(product_number):
+    """Unique product name (checkout looks products up by name)"""
+    ingredient = ACTIVE_INGREDIENTS[product_number % len(ACTIVE_INGREDIENTS)]
+    formulation = FORMULATIONS[product_number % len(FORMULATIONS)]
+    return f'{ingredient} {formulation} {product_number:06d}'
+
+
+def product_rows(rng, count, start):
+    for n in range(count):
+        category = CATEGORIES[n % len(CATEGORIES)]
+        crop = rng.choice(CROPS)
+        yield (
+            product_name(n),
+            category,
+            f'{category.capitalize()} for {crop} with {rng.randint(5, 60)}% active ingredient',
+            round(rng.uniform(5, 250), 2),
+            rng.choice(SIZES),
+            BENCHMARK_STOCK,
+            round(rng.uniform(3, 5), 1),
+            timestamp(rng, start)
+        )
+
+
+def customer_rows(rng, count, start):
+    for n in range(count):
+        yield (
+            f'Farmer {n}',
+            f'farmer{n}@example.com',
+            f'+91-{rng.randrange(10 ** 9, 10 ** 10)}',
+            rng.randint(1, 500),
+            rng.choice(CROPS),
+            f'{rng.randint(1, 999)} Village Road, District {n % 100}',
+            timestamp(rng, start)
+        )
+
+
+def order_rows(rng, count, first_id, customer_ids, catalog, start):
+    """Yield (order, items) pairs with totals matching their items"""
+    for order_id in range(first_id, first_id + count):
+        items = [
+            (order_id, product_id, rng.randint(1, 10), price)
+            for product_id, price in rng.sample(catalog, rng.randint(1, 4))
+        ]
+        order = (
+            order_id,
+            f'SYN-{order_id:09d}',
+            rng.choice(customer_ids),
+            round(sum(quantity * price for _, _, quantity, price in items), 2),
+            rng.choice(STATUSES),
+            f'{rng.randint(1, 999)} Farm Lane',
+            timestamp(rng, start)
+        )
+        yield order, items
+
+
+def insert_chunks(conn, sql, rows):
+    """executemany in CHUNK_ROWS chunks; returns the number of rows"""
+    total = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_ROWS))
+        if not chunk:
+            return total
+        conn.executemany(sql, chunk)
+        total += len(chunk)
+
+
+def generate(conn, products=100000, customers=50000, orders=1000000, seed=42):
+    """Append a synthetic catalog, customers and order history (caller commits)"""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=HISTORY_DAYS)
+
+    insert_chunks(conn, '''
+        INSERT INTO products (name, category, description, price, size, stock, rating, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', product_rows(rng, products, start))
+
+    insert_chunks(conn, '''
+        INSERT INTO customers (name, email, phone, farm_size, crop_type, address, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', customer_rows(rng, customers, start))
+
+    catalog = [tuple(row) for row in conn.execute('SELECT id, price FROM products')]
+    customer_ids = [row[0] for row in conn.execute('SELECT id FROM customers')]
+    first_id = (conn.execute('SELECT MAX(id) FROM orders').fetchone()[0] or 0) + 1
+
+    rows = order_rows(rng, orders, first_id, customer_ids, catalog, start)
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_ROWS))
+        if not chunk:
+            break
+        conn.executemany('''
+            INSERT INTO orders (id, order_number, customer_id, total_amount, status, delivery_address, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [order for order, items in chunk])
+        conn.executemany('''
+            INSERT INTO order_items (order_id, product_id, quantity, price)
+            VALUES (?, ?, ?, ?)
+        ''', [item for order, items in chunk for item in items])
+
+    dashboard.rebuild(conn)
+
+
+def create_database(path, products=100000, customers=50000, orders=1000000, seed=42):
+    """Create a fresh database at path with the schema, seed data and synthetic rows"""
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} already exists')
+
+    app.config['DATABASE'] = path
+    init_db()
+    seed_data()
+
+    conn = connect_db()
+    started = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    generate(conn, products, customers, orders, seed)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create a database filled with synthetic data')
+    parser.add_argument('database')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    elapsed = create_database(args.database, args.products, args.customers, args.orders, args.seed)
+    print(f"Generated {args.products} products, {args.customers} customers and "
+          f"{args.orders} orders in {elapsed:.1f}s -> {args.database}")
@@ -5,6 +5,7 @@ Run this after starting the Flask server to test all endpoints
 
 import requests
 import json
+import time
 
 BASE_URL = 'http://localhost:5000'
 
@@ -49,6 +50,10 @@ def test_validate_discount():
     data = {"code": "SAVE10"}
     response = requests.post(f'{BASE_URL}/api/discount/validate', json=data)
     print_response("VALIDATE DISCOUNT CODE (SAVE10)", response)
+    
+    data = {"code": "SAVE10", "items": [{"product": "Glyphosate", "quantity": 2}]}
+    response = requests.post(f'{BASE_URL}/api/discount/validate', json=data)
+    print_response("VALIDATE DISCOUNT CODE AGAINST A CART (SAVE10)", response)
 
 def test_create_order():
     """Test create order"""
@@ -88,6 +93,62 @@ def test_create_order():
         return response.json().get('order_id')
     return None
 
+def test_create_order_idempotent():
+    """Test that retrying an order with the same Idempotency-Key doesn't duplicate it"""
+    order_data = {
+        "customer": {
+            "name": "Retry Customer",
+            "email": "retry@example.com",
+            "phone": "+91-9876543210",
+            "delivery": "1 Retry Lane"
+        },
+        "items": [
+            {"product": "Mancozeb", "quantity": 1, "price": 28.50}
+        ],
+        "total": 28.50
+    }
+    headers = {'Idempotency-Key': f'test-{time.time()}'}
+    
+    first = requests.post(f'{BASE_URL}/api/orders', json=order_data, headers=headers)
+    print_response("CREATE ORDER (Idempotency-Key)", first)
+    retry = requests.post(f'{BASE_URL}/api/orders', json=order_data, headers=headers)
+    print_response("RETRY ORDER (same Idempotency-Key)", retry)
+    
+    if first.status_code == 201 and retry.status_code == 201:
+        same = first.json()['order_id'] == retry.json()['order_id']
+        print(f"Same order returned on retry: {same}")
+
+def test_reserve_and_order():
+    """Test holding stock at checkout and confirming it with the order"""
+    items = [{"product": "Glyphosate", "quantity": 1, "price": 89.99}]
+    
+    reserved = requests.post(f'{BASE_URL}/api/reservations', json={"items": items, "ttl": 300})
+    print_response("RESERVE STOCK", reserved)
+    if reserved.status_code != 201:
+        return
+    reservation_id = reserved.json()['reservation_id']
+    
+    response = requests.get(f'{BASE_URL}/api/reservations/{reservation_id}')
+    print_response("GET RESERVATION", response)
+    
+    order_data = {
+        "customer": {
+            "name": "Reserved Customer",
+            "email": "reserved@example.com",
+            "phone": "+91-9876543210",
+            "delivery": "2 Hold Street"
+        },
+        "items": items,
+        "total": 89.99,
+        "reservation_id": reservation_id
+    }
+    response = requests.post(f'{BASE_URL}/api/orders', json=order_data)
+    print_response("CREATE ORDER (with reservation)", response)
+    
+    # The reservation is used up by the order
+    response = requests.delete(f'{BASE_URL}/api/reservations/{reservation_id}')
+    print_response("RELEASE RESERVATION (already confirmed)", response)
+
 def test_get_orders():
     """Test get all orders"""
     response = requests.get(f'{BASE_URL}/api/orders')
@@ -194,6 +255,8 @@ def run_all_tests():
         
         # Order tests
         order_id = test_create_order()
+        test_create_order_idempotent()
+        test_reserve_and_order()
         test_get_orders()
         test_get_order_by_id(order_id)
         test_update_order_status(order_id)
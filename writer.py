@@ -0,0 +1,160 @@
+"""
+Single-writer queue for AgriChem Solutions API
+SQLite allows one writer at a time. Instead of every request thread opening
+its own write transaction (and timing out with "database is locked" under
+load), writes are handed to one dedicated connection on its own thread.
+
+Whatever is queued when the writer wakes up is committed together (group
+commit): one BEGIN IMMEDIATE, a SAVEPOINT per job so a failing job only
+rolls back its own changes, and a single COMMIT (one fsync) for the batch.
+Each caller gets its own result or exception once the batch is durable.
+Run benchmark_writes.py for throughput numbers.
+"""
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+# Tells the writer thread to stop
+_STOP = object()
+
+
+class WriteQueue:
+    """One connection (opened by connect() on the writer thread), batched write transactions"""
+    
+    def __init__(self, connect, max_batch=64):
+        self.connect = connect
+        self.max_batch = max_batch
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+        
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+    
+    def is_alive(self):
+        """False once the writer thread has stopped"""
+        return self._thread.is_alive()
+    
+    def submit(self, work):
+        """Queue work(cursor) to run in a write transaction; returns a Future"""
+        if not self.is_alive():
+            raise RuntimeError('Writer is closed')
+        future = Future()
+        # The job's SQL counts towards the submitting request's metrics
+        self._queue.put((metrics.bind(work), future))
+        return future
+    
+    def run(self, work):
+        """Run work(cursor) in a write transaction and return its result once committed"""
+        return self.submit(work).result()
+    
+    def close(self):
+        """Finish the queued work and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+    
+    def stats(self):
+        """Batching counters (average batch size = jobs / batches)"""
+        return {
+            'batches': self.batches,
+            'jobs': self.jobs,
+            'pending': self._queue.qsize()
+        }
+    
+    def _run(self):
+        # The connection is opened, used and closed on this thread only
+        try:
+            conn = self.connect()
+            conn.isolation_level = None  # transactions are managed explicitly below
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        
+        try:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                
+                if _STOP in batch:
+                    stopping = True
+                    batch = [job for job in batch if job is not _STOP]
+                if batch:
+                    self._commit_batch(conn, batch)
+        finally:
+            conn.close()
+            # Jobs queued while the thread was stopping are failed, not left waiting
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not _STOP and job[1].set_running_or_notify_cancel():
+                    job[1].set_exception(RuntimeError('Writer is closed'))
+    
+    def _commit_batch(self, conn, batch):
+        """Run a batch of jobs in one transaction and resolve their futures
+        
+        Never raises: if the transaction itself fails (BEGIN, a savepoint or
+        COMMIT), nothing in the batch was committed and every job gets the error.
+        """
+        outcomes = []
+        started = []   # futures moved to running, whether or not they got an outcome
+        touched = 0    # jobs of the batch whose future has been claimed (or found cancelled)
+        
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for work, future in batch:
+                touched += 1
+                if not future.set_running_or_notify_cancel():
+                    continue
+                started.append(future)
+                conn.execute('SAVEPOINT job')
+                try:
+                    result = work(conn.cursor())
+                    conn.execute('RELEASE job')
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+                    # Undo only this job's changes; the rest of the batch carries on
+                    conn.execute('ROLLBACK TO job')
+                    conn.execute('RELEASE job')
+            conn.execute('COMMIT')
+        except Exception as e:
+            self._rollback(conn)
+            errors = {id(future): error for future, _, error in outcomes}
+            outcomes = [(future, None, errors.get(id(future)) or e) for future in started]
+            outcomes += [(future, None, e) for work, future in batch[touched:]
+                         if future.set_running_or_notify_cancel()]
+        
+        self.batches += 1
+        self.jobs += len(outcomes)
+        
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+    
+    def _rollback(self, conn):
+        """Roll back whatever is left of a failed batch (SQLite may have done it already)"""
+        if conn.in_transaction:
+            try:
+                conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass